@@ -0,0 +1,120 @@
+using UnityEngine;
+using System;
+using System.Collections.Generic;
+using System.IO;
+using System.Text;
+
+// Decodes the compact binary terrain layout served by /Generate/ for "Accept: application/x-anvil-terrain".
+//      Little-endian throughout, every block starts on a 4 byte boundary.
+//      Header:     magic "ANVL", uint16 version, uint16 reserved, uint32 mesh count
+//      Per mesh:   float32[3] worldPos, uint32 vert count, uint32 index count,
+//                  uint8 index width (2 or 4), 3 bytes padding,
+//                  float32[vert count * 3] verts, uint16/uint32[index count] indices, padding
+public class BinarySerializationOption : ISerializationOption
+{
+    private const string Magic = "ANVL";
+    private const int Version = 1;
+
+    // The graph we post is still JSON, only the response is binary.
+    public string ContentType { get { return "application/json"; } }
+    public string Accept { get { return "application/x-anvil-terrain"; } }
+
+    public T Deserialize<T>(string text)
+    {
+        Debug.LogError($"{this} expects a binary response, use Deserialize<T>(byte[]).");
+        return default;
+    }
+
+    // Only GeneratedTerrain can be read from the binary layout.
+    public T Deserialize<T>(byte[] data)
+    {
+        if (typeof(T) != typeof(GeneratedTerrain))
+        {
+            Debug.LogError($"{this} can only deserialize {nameof(GeneratedTerrain)}, not {typeof(T).Name}.");
+            return default;
+        }
+
+        try
+        {
+            GeneratedTerrain result = ReadTerrain(data);
+            Debug.Log($"Success : {result.terrain.Count} meshes from {data.Length} bytes");
+            return (T)(object)result;
+        }
+
+        catch(Exception ex)
+        {
+            Debug.LogError($"{this} could not parse binary terrain of {data.Length} bytes. {ex.Message}");
+            return default;
+        }
+    }
+
+    public static GeneratedTerrain ReadTerrain(byte[] data)
+    {
+        using var reader = new BinaryReader(new MemoryStream(data));
+
+        string magic = Encoding.ASCII.GetString(reader.ReadBytes(4));
+        int version = reader.ReadUInt16();
+        reader.ReadUInt16(); // Reserved
+
+        if (magic != Magic || version != Version)
+        {
+            throw new InvalidDataException($"Unexpected header {magic} version {version}");
+        }
+
+        int meshCount = (int)reader.ReadUInt32();
+        List<MeshData> terrain = new List<MeshData>(meshCount);
+
+        for (int m = 0; m < meshCount; m++)
+        {
+            terrain.Add(ReadMesh(reader));
+        }
+
+        return new GeneratedTerrain(terrain);
+    }
+
+    private static MeshData ReadMesh(BinaryReader reader)
+    {
+        MeshData mesh = new MeshData();
+        mesh.worldPos = new Vector3(reader.ReadSingle(), reader.ReadSingle(), reader.ReadSingle());
+
+        int vertCount = (int)reader.ReadUInt32();
+        int indexCount = (int)reader.ReadUInt32();
+        int indexWidth = reader.ReadByte();
+        reader.ReadBytes(3); // Padding
+
+        // Copy the vertex block straight into the Vector3 array, three floats per vert.
+        byte[] vertBytes = reader.ReadBytes(vertCount * 12);
+        float[] coords = new float[vertCount * 3];
+        Buffer.BlockCopy(vertBytes, 0, coords, 0, vertBytes.Length);
+
+        mesh.verts = new Vector3[vertCount];
+        for (int i = 0; i < vertCount; i++)
+        {
+            mesh.verts[i] = new Vector3(coords[i * 3], coords[i * 3 + 1], coords[i * 3 + 2]);
+        }
+
+        mesh.indices = new int[indexCount];
+        if (indexWidth == 2)
+        {
+            for (int i = 0; i < indexCount; i++)
+            {
+                mesh.indices[i] = reader.ReadUInt16();
+            }
+        }
+        else if (indexWidth == 4)
+        {
+            byte[] indexBytes = reader.ReadBytes(indexCount * 4);
+            Buffer.BlockCopy(indexBytes, 0, mesh.indices, 0, indexBytes.Length);
+        }
+        else
+        {
+            throw new InvalidDataException($"Unsupported index width {indexWidth}");
+        }
+
+        // Index blocks are padded out to the next 4 byte boundary.
+        int padding = (4 - (indexCount * indexWidth) % 4) % 4;
+        reader.ReadBytes(padding);
+
+        return mesh;
+    }
+}
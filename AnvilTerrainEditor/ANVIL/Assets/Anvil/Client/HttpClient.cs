@@ -25,6 +25,7 @@ public class HttpClient
 
             // Set the content type - What are we dealing with?
             www.SetRequestHeader("Content-Type", serializationOption.ContentType);
+            www.SetRequestHeader("Accept", serializationOption.Accept);
 
             var operation = www.SendWebRequest();
 
@@ -33,7 +34,7 @@ public class HttpClient
                 await Task.Yield();
             }
 
-            var response = www.downloadHandler.text; // Get the response packet
+            var response = www.downloadHandler.data; // Get the response packet
 
             // Check for success
             if (www.result != UnityWebRequest.Result.Success)
@@ -42,7 +43,7 @@ public class HttpClient
                 return default;
             }
 
-            Debug.Log("Parsing " + response);
+            Debug.Log($"Parsing {response.Length} bytes");
 
             TResultType result = serializationOption.Deserialize<TResultType>(response);
             return result;
@@ -65,6 +66,7 @@ public class HttpClient
 
             // Set the content type - What are we dealing with?
             www.SetRequestHeader("Content-Type", serializationOption.ContentType);
+            www.SetRequestHeader("Accept", serializationOption.Accept);
 
             var operation = www.SendWebRequest();
 
@@ -73,7 +75,7 @@ public class HttpClient
                 await Task.Yield();
             }
 
-            var response = www.downloadHandler.text; // Get the response packet
+            var response = www.downloadHandler.data; // Get the response packet
 
             // Check for success
             if (www.result != UnityWebRequest.Result.Success)
@@ -82,7 +84,7 @@ public class HttpClient
                 return default;
             }
 
-            Debug.Log("Parsing " + response);
+            Debug.Log($"Parsing {response.Length} bytes");
 
             TResultType result = serializationOption.Deserialize<TResultType>(response);
             return result;
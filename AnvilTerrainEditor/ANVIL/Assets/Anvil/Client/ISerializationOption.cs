@@ -5,6 +5,12 @@ using UnityEngine;
 // A way to define serialization options without excessive dependencies.
 public interface ISerializationOption
 {
+    // Content type of the request payload we send.
     string ContentType { get; }
+
+    // Response format we ask the server for, sent as the Accept header.
+    string Accept { get; }
+
     T Deserialize<T>(string text);
+    T Deserialize<T>(byte[] data);
 }
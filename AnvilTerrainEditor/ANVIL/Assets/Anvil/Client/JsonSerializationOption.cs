@@ -1,10 +1,12 @@
 using UnityEngine;
 using Newtonsoft.Json;
 using System;
+using System.Text;
 
 public class JsonSerializationOption : ISerializationOption
 {
     public string ContentType { get { return "application/json"; } }
+    public string Accept { get { return "application/json"; } }
 
     // Takes some string and deserializes it into a compatible JSON object.
     public T Deserialize<T>(string text)
@@ -23,4 +25,10 @@ public class JsonSerializationOption : ISerializationOption
             return default;
         }
     }
+
+    // JSON arrives as UTF-8 text.
+    public T Deserialize<T>(byte[] data)
+    {
+        return Deserialize<T>(Encoding.UTF8.GetString(data));
+    }
 }
@@ -114,6 +114,13 @@ public class TerrainEditor : EditorWindow
     private bool autoGenerate = false;
     private bool autoSave = true;
 
+    // With the seed locked, the same graph generates the same terrain, and the server can return it from its cache.
+    private bool lockSeed = false;
+    private int seed = 0;
+
+    // Ask the server for the compact binary terrain layout instead of JSON.
+    private bool binaryTerrain = true;
+
     // Here is the styling references
     private GUIStyle nodeStyle;
     private GUIStyle selectedNodeStyle;
@@ -206,6 +213,13 @@ public class TerrainEditor : EditorWindow
             GenerateTerrain();
         }
 
+        lockSeed = GUILayout.Toggle(lockSeed, new GUIContent("Seed"), EditorStyles.toolbarButton, GUILayout.Width(50));
+        GUI.enabled = lockSeed;
+        seed = EditorGUILayout.IntField(seed, EditorStyles.toolbarTextField, GUILayout.Width(80));
+        GUI.enabled = true;
+
+        binaryTerrain = GUILayout.Toggle(binaryTerrain, new GUIContent("Binary"), EditorStyles.toolbarButton, GUILayout.Width(50));
+
         GUILayout.FlexibleSpace();
 
         autoSave = GUILayout.Toggle(autoSave, new GUIContent("Auto"), EditorStyles.toolbarButton, GUILayout.Width(50));
@@ -230,8 +244,12 @@ public class TerrainEditor : EditorWindow
         string graphJSON = JsonUtility.ToJson(currentGraph);
 
         // Open an Http Client Request
-        HttpClient client = new HttpClient(new JsonSerializationOption());
+        ISerializationOption serialization = binaryTerrain ? (ISerializationOption) new BinarySerializationOption() : new JsonSerializationOption();
+        HttpClient client = new HttpClient(serialization);
         string url = "http://10.0.0.63:105/Generate/";
+        if (lockSeed) {
+            url += "?seed=" + seed;
+        }
 
         // Await response from the generator.
         GeneratedTerrain genTerrain = await client.Post<GeneratedTerrain>(url, graphJSON);
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+
+from os.path import abspath, basename, dirname, exists, isabs, join, normpath
+
+from typing import Dict, Mapping, Optional
+
+from ModelRegistry import VERT_GEN_MODEL
+
+
+# Where Anvil reads its island set and models from, and writes its caches and exports to.
+#       Each path is resolved from, highest priority first:
+#           command line flags      --island-set, --island-cache, --model-dir, --model-file, --result-cache
+#           environment variables   ANVIL_ISLAND_SET, ANVIL_ISLAND_CACHE, ANVIL_MODEL_DIR, ANVIL_MODEL_FILE, ANVIL_RESULT_CACHE
+#           a JSON config file      --config, ANVIL_CONFIG, or anvil_config.json next to this file
+#           defaults                IslandSet/ and the models next to this file
+#       Relative paths in a config file are relative to the file, all others to the working directory.
+#       e.g. anvil_config.json:
+#           {"island_set": "/mnt/ssd/IslandSet", "island_cache": "/dev/shm/anvil", "model_dir": "/srv/anvil/models"}
+
+PACKAGE_DIR = dirname(abspath(__file__))
+CONFIG_FILE_NAME = "anvil_config.json"
+CONFIG_ENV = "ANVIL_CONFIG"
+
+DEFAULT_ISLAND_SET = join(PACKAGE_DIR, "IslandSet")
+DEFAULT_MODEL_DIR = PACKAGE_DIR
+
+# Each path setting, with the environment variable that sets it.
+PATH_SETTINGS: Dict[str, str] = {
+    "island_set": "ANVIL_ISLAND_SET",
+    "island_cache": "ANVIL_ISLAND_CACHE",
+    "model_dir": "ANVIL_MODEL_DIR",
+    "model_file": "ANVIL_MODEL_FILE",
+    "result_cache": "ANVIL_RESULT_CACHE",
+}
+
+
+class AnvilPaths:
+
+    def __init__(self, island_set: str, island_cache: Optional[str], model_dir: str, model_file: str, result_cache: Optional[str]):
+        """
+        Args:
+            island_set: Folder of .obj island meshes, the training set and mesh corpus
+            island_cache: Folder island caches are kept in, None keeps each in its island folder
+            model_dir: Folder training exports its models to
+            model_file: Generator the server loads, vert_gen.model in model_dir by default
+            result_cache: Folder of the server's on-disk result cache, None keeps results in memory only
+        """
+        self.island_set = island_set
+        self.island_cache = island_cache
+        self.model_dir = model_dir
+        self.model_file = model_file
+        self.result_cache = result_cache
+
+    def model_path(self, name: str) -> str:
+        return join(self.model_dir, name)
+
+    def island_cache_dir(self, directory: str) -> Optional[str]:
+        """Cache folder of an island folder under island_cache, or None to keep it in the island folder.
+            Each island folder gets its own, so copies of a set don't overwrite each other's cache.
+        """
+        if self.island_cache is None:
+            return None
+        key = hashlib.sha1(normpath(abspath(directory)).encode("utf-8")).hexdigest()[:12]
+        return join(self.island_cache, basename(normpath(abspath(directory))) + "-" + key)
+
+    def as_dict(self) -> Dict[str, Optional[str]]:
+        return {key: getattr(self, key) for key in PATH_SETTINGS}
+
+
+def read_config_file(path: str) -> Dict[str, str]:
+    with open(path) as file:
+        settings = json.load(file)
+
+    unknown = [key for key in settings if key not in PATH_SETTINGS]
+    if unknown:
+        raise ValueError(path + " has unknown settings " + ", ".join(unknown) + ", expected " + ", ".join(PATH_SETTINGS))
+
+    # Relative to the config file, so a config works from any working directory.
+    return {key: value if value is None or isabs(value) else join(dirname(abspath(path)), value) for key, value in settings.items()}
+
+def resolve_paths(config_file: Optional[str] = None, environ: Optional[Mapping[str, str]] = None, **overrides: Optional[str]) -> AnvilPaths:
+    """Resolves every path setting, from overrides, then environ, then the config file, then the defaults.
+    Args:
+        config_file: JSON config file, ANVIL_CONFIG or anvil_config.json next to this file if None
+        environ: Environment variables, os.environ if None
+        overrides: Settings given on the command line, None values are left unset
+    """
+    environ = os.environ if environ is None else environ
+    settings: Dict[str, Optional[str]] = {
+        "island_set": DEFAULT_ISLAND_SET,
+        "island_cache": None,
+        "model_dir": DEFAULT_MODEL_DIR,
+        "model_file": None,
+        "result_cache": None
+    }
+
+    config_file = config_file or environ.get(CONFIG_ENV)
+    if config_file is None and exists(join(PACKAGE_DIR, CONFIG_FILE_NAME)):
+        config_file = join(PACKAGE_DIR, CONFIG_FILE_NAME)
+    if config_file is not None:
+        settings.update(read_config_file(config_file))
+
+    for key, variable in PATH_SETTINGS.items():
+        if environ.get(variable):
+            settings[key] = environ[variable]
+
+    for key, value in overrides.items():
+        if key not in PATH_SETTINGS:
+            raise ValueError("Unknown path setting " + key)
+        if value is not None:
+            settings[key] = value
+
+    if settings["model_file"] is None:
+        settings["model_file"] = join(settings["model_dir"], VERT_GEN_MODEL)
+
+    return AnvilPaths(**settings)
+
+
+# COMMAND LINES
+def add_path_arguments(parser):
+    """Adds the path flags, all defaulting to the environment, config file and built in defaults."""
+    parser.add_argument("--config", default=None, help="JSON config file of paths, default $" + CONFIG_ENV + " or " + CONFIG_FILE_NAME)
+    parser.add_argument("--island-set", default=None, help="Folder of .obj island meshes")
+    parser.add_argument("--island-cache", default=None, help="Folder island caches are kept in, each island folder's own by default")
+    parser.add_argument("--model-dir", default=None, help="Folder models are exported to and loaded from")
+    parser.add_argument("--model-file", default=None,
+        help="Generator to serve: a training export (.model), or a TorchScript (.ts) or ONNX (.onnx) runtime export")
+    parser.add_argument("--result-cache", default=None, help="Folder the server caches generated responses in, memory only by default")
+
+def configure_paths_from_args(args) -> AnvilPaths:
+    return configure_paths(args.config, island_set=args.island_set, island_cache=args.island_cache,
+        model_dir=args.model_dir, model_file=args.model_file, result_cache=args.result_cache)
+
+
+# The paths of this process, resolved on first use.
+_paths: Optional[AnvilPaths] = None
+
+def get_paths() -> AnvilPaths:
+    global _paths
+    if _paths is None:
+        _paths = resolve_paths()
+    return _paths
+
+def configure_paths(config_file: Optional[str] = None, **overrides: Optional[str]) -> AnvilPaths:
+    """Replaces this process' paths, e.g. with the command line's.
+        Meant to be called once at startup, before anything is loaded.
+    """
+    global _paths
+    _paths = resolve_paths(config_file, **overrides)
+    return _paths
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shows the paths Anvil resolves from its flags, environment and config file")
+    add_path_arguments(parser)
+    args = parser.parse_args()
+
+    for key, value in configure_paths_from_args(args).as_dict().items():
+        print("{:<14} {}".format(key, value))
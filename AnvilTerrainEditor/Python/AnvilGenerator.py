@@ -1,30 +1,51 @@
 from operator import index
 from flask import Flask
 from flask import request
+from flask import Response
+from flask import jsonify
+from flask import abort
 
 import time
 import sys
+import os
 import math
+import random
+import argparse
 
 from codecs import decode
 import struct
 
-import torch
-import torch.nn as nn
-import torch.optim as optim
-
-# 
-from Models import *
+# torch, the models and the training code are imported where they're used, so serving from the
+#       mesh corpus starts without them.
 from Utils import *
-from Generator import *
-
-from typing import List, Tuple
-
-
-def genned_data_to_vector_list(gen_data):
-    # Genned data in form list of size 3074.
-    vector_list = []
-    return gen_data
+from MeshCorpus import configure_corpus, get_corpus
+from ModelRegistry import get_registry
+from AnvilConfig import add_path_arguments, configure_paths_from_args
+from InferenceScheduler import configure_scheduler, get_scheduler
+from InferenceScheduler import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT, DEFAULT_MAX_QUEUE_DEPTH
+from ResultCache import DEFAULT_MAX_BYTES, DEFAULT_DISK_MAX_BYTES, configure_result_cache, get_result_cache, graph_key
+from Serving import SERVE_MODES, DEFAULT_HOST, DEFAULT_PORT, DEFAULT_WORKERS, DEFAULT_THREADS, serve
+from TerrainSerializer import JSON_MIMETYPE, BINARY_MIMETYPE
+from TerrainSerializer import iter_terrain_json, serialize_terrain, iter_terrain_binary, serialize_terrain_binary
+from TrainingArguments import add_training_arguments
+
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import torch
+
+
+def genned_data_to_vector_list(gen_data: "torch.Tensor") -> np.ndarray:
+    # Genned data in form (batch, values), read as consecutive x, y, z triples.
+    #       Any trailing values that don't complete a vertex are dropped.
+    #       DC generators output (batch, channels, res, res) images instead: three channels are
+    #       the x, y and z of each pixel's vertex, any other count is read as flat values.
+    if gen_data.dim() == 4:
+        if gen_data.shape[1] == 3:
+            return gen_data.flatten(2).transpose(1, 2).numpy()
+        gen_data = gen_data.flatten(1)
+    vert_count = gen_data.shape[-1] // 3
+    return gen_data[..., :vert_count * 3].reshape(*gen_data.shape[:-1], vert_count, 3).numpy()
 
 
 # Default Cube - 
@@ -58,53 +79,93 @@ cubeIndices = [
     4, 0, 1
 ]
 
-def get_random_mesh(meshList, gennedMesh):
-    index = random.randint(0, (len(meshList)-1))
-    
-    # Check for bad index, default to 0
-    if index < 0 or index >= len(meshList):
-        index = 0
+def get_random_mesh(corpus, gennedMesh, rng=None):
+    # Pick any resident mesh from the corpus, no disk access. A seeded rng picks the same every time.
+    source = corpus.random_mesh(rng)
 
-    gennedMesh.verts = meshList[index].verts
-    gennedMesh.indices = meshList[index].indices
+    gennedMesh.verts = source.verts
+    gennedMesh.indices = source.indices
     return gennedMesh
 
 # Given a node, generate a mesh using the GAN.
-def genIslandMesh(island, debug=True):
-    if debug:
-
-        tempFilePath = "C:/AnvilTerrainEditor/Python/IslandSet/1.obj"
+def genIslandMesh(island, debug=True, seed=None):
+    return genIslandMeshes([island], debug, seed)[0]
 
-        # Generated mesh
-        genData = loadMeshFromFile(tempFilePath)
-        genData.worldPos = island.pos
-        genData.toBinary()
+# Given every node in the graph, generate all of their meshes with one batched pass through the GAN.
+#       With a seed, the generator's noise and so the meshes are the same every time.
+def genIslandMeshes(islands, debug=True, seed=None) -> List[MeshData]:
+    if debug:
 
-        return genData
+        # Empty placeholders, the caller fills each one with a mesh from the corpus.
+        return [MeshData(island.pos, [], []) for island in islands]
 
     else:
-        vert_generator = torch.load("vert_gen.model")
-        genned_verts = vert_generator( generate_noise(1) ).tolist()
+        if len(islands) == 0:
+            return []
+
+        # One noise row per island. The scheduler batches them together with the islands of any
+        #       concurrent requests into a single forward pass through the resident generator.
+        genned_verts = get_scheduler().generate(len(islands), seed)
 
         # print("Genned Values:")
         # print(genned_verts)
 
-        verts = []
-        for step in range(0, len(genned_verts[0]), 3):
-            newVec = Vector3(
-                    genned_verts[0][step],
-                    genned_verts[0][step+1],
-                    genned_verts[0][step+2]
-                )
-            verts.append(newVec)
-        testNewMesh = MeshData(Vector3(0,0,0), verts, cubeIndices)
-
-        return testNewMesh
+        # (islands, verts, 3), each island gets a view onto its own row.
+        batch_verts = genned_data_to_vector_list(genned_verts)
+        return [MeshData(island.pos, verts, cubeIndices) for island, verts in zip(islands, batch_verts)]
 
 # Given a bridge, generate a mesh using the GAN
 def genBridgeMesh(bridge):
     return MeshData(bridge.pos, cubeVerts, cubeIndices)
 
+# Islands come from the mesh corpus unless --use-model is given, which runs them through the
+#       generator and imports torch.
+generate_from_model = False
+
+# Artificial latency, off in production. Set for testing the async path in Unity, either with
+#       ANVIL_LATENCY / ANVIL_LATENCY_JITTER (seconds) or --latency / --latency-jitter.
+injected_latency = float(os.environ.get("ANVIL_LATENCY", 0.0))
+injected_jitter = float(os.environ.get("ANVIL_LATENCY_JITTER", 0.0))
+
+def inject_latency() -> float:
+    """Sleeps for the configured latency plus a uniform random jitter.
+    Returns:
+        The number of seconds slept.
+    """
+    delay = injected_latency
+    if injected_jitter > 0:
+        delay += random.uniform(0, injected_jitter)
+
+    if delay > 0:
+        time.sleep(delay)
+    return delay
+
+def request_seed(content) -> Optional[int]:
+    # From the graph's "seed", or ?seed=, None if the request has neither.
+    seed = content.get("seed", request.args.get("seed"))
+    if seed is None:
+        return None
+    try:
+        return int(seed)
+    except (TypeError, ValueError):
+        abort(400, "seed must be an integer")
+
+def result_version() -> Optional[str]:
+    # Everything a response depends on besides its graph, seed and format, None if that isn't known yet.
+    version = "corpus-" + get_corpus().version
+    if generate_from_model:
+        scheduler = get_scheduler()
+        registry = scheduler.registry if scheduler.registry is not None else get_registry()
+
+        # A cache hit never reaches the scheduler, so the model is fetched here too. That loads it
+        #       on first use, and reloads it once its file changed, before it goes into the key.
+        registry.get(scheduler.model_path)
+        model_version = registry.version(scheduler.model_path)
+        if model_version is None:
+            return None
+        version += ":model-" + repr(model_version) + ":" + scheduler.precision
+    return version
+
 # Creates instance of the class
 app = Flask(__name__)
 
@@ -115,8 +176,9 @@ def generate():
     content = request.json
     # print("Receiving", content)
 
-    # TEMP  Load True Distribution
-    labels, mesh_list = load_island_data()
+    # True Distribution, kept resident across requests
+    corpus = get_corpus()
+    corpus.maybe_refresh()
 
     # We need to serialize the data from JSON into iterable collections of islands and bridges.
     connections = content.get("connections")
@@ -125,6 +187,28 @@ def generate():
     # Place an index for each node and connection.
     start_time = time.time()
 
+    # Clients that send "Accept: application/x-anvil-terrain" get the compact binary layout,
+    #       everyone else gets JSON.
+    mimetype = request.accept_mimetypes.best_match([JSON_MIMETYPE, BINARY_MIMETYPE], default=JSON_MIMETYPE)
+    stream = request.args.get("stream") == "1"
+
+    # A seeded graph generates the same terrain every time, so its response is cached, already serialized.
+    #       Unseeded graphs are random, and always generated. The Unity editor sends ?seed= once its seed is locked.
+    seed = request_seed(content)
+    result_cache = get_result_cache()
+    version = result_version() if result_cache.enabled and seed is not None else None
+    cache_key = None
+    if version is not None:
+        cache_key = graph_key(nodes, connections, seed, version, mimetype)
+        body = result_cache.get(cache_key)
+        if body is not None:
+            inject_latency()
+            print("Result cache hit in", str(time.time() - start_time), "seconds, returning...")
+            return Response(body, status=202, mimetype=mimetype)
+    elif result_cache.enabled:
+        result_cache.bypass()
+    rng = random.Random(seed) if seed is not None else None
+
     # Iterate over every node in the graph
     print("Islands: ")
     islands = [0 for i in nodes] 
@@ -163,55 +247,133 @@ def generate():
     # Generate a Mesh for each Island
     terrainMesh = [0 for i in nodes]
 
-    # For each island, assign data to matching terrainMesh slot
-    for island in islands:
-        random_island = genIslandMesh(island, debug=True)
-        random_island = get_random_mesh(mesh_list, random_island)
-        terrainMesh[island.index] = random_island
+    # Model loads are timed by the registry, keep them out of the inference time.
+    registry = get_registry()
+    load_time = registry.total_load_time
+    inference_start = time.time()
+
+    # Generate every island at once, then assign each to its matching terrainMesh slot.
+    #       Without the model, each island is a random mesh from the corpus.
+    for island, genned_island in zip(islands, genIslandMeshes(islands, debug=not generate_from_model, seed=seed)):
+        if not generate_from_model:
+            genned_island = get_random_mesh(corpus, genned_island, rng)
+        terrainMesh[island.index] = genned_island
+
+    load_time = registry.total_load_time - load_time
+    inference_time = time.time() - inference_start - load_time
 
     # For each bridge, append data to terrainMesh
     for bridge in bridges:
         random_bridge = genBridgeMesh(bridge)
-        random_bridge = get_random_mesh(mesh_list, random_bridge)
+        random_bridge = get_random_mesh(corpus, random_bridge, rng)
         terrainMesh.append(random_bridge)
 
-    # To simulate wait time on end-point, can test async operation in Unity.
-    time.sleep(1)
+    # To simulate wait time on end-point, can test async operation in Unity. Zero unless enabled.
+    injected_time = inject_latency()
 
     # Return packed JSON
-    print("\nGeneration Success in", str(time.time() - start_time), "seconds, returning...")
+    print("\nIsland inference in", str(inference_time), "seconds, model loading in", str(load_time), "seconds")
+    if injected_time > 0:
+        print("Injected latency of", str(injected_time), "seconds")
+    print("Generation Success in", str(time.time() - start_time), "seconds, returning...")
 
-    packedJSON = '{ "terrain" : [ '
+    if mimetype == BINARY_MIMETYPE:
+        body = iter_terrain_binary(terrainMesh) if stream else serialize_terrain_binary(terrainMesh)
 
-    count = 0
-    maxMeshCount = len(terrainMesh)
+    # Return packed JSON, streamed as chunks when the client asks for ?stream=1
+    elif stream:
+        body = iter_terrain_json(terrainMesh)
 
-    # Append string for each terrain generated
-    for terrain in terrainMesh:
-        packedJSON += terrain.toJSON()
+    # return '{ "terrain" : [ { "worldPos": { "x": 1, "y": 0, "z": 1 }, "verts" : [ {"x": 5.4, "y": 3.8, "z": 2.1 }, {"x": 1.2, "y": 0.52, "z": -2.1 } ], "indices" : [ 0, 1, 2 ] } ] }', 202
+    else:
+        body = serialize_terrain(terrainMesh)
 
-        count += 1
-        if count < maxMeshCount:
-            packedJSON += ', '
+    # Streamed responses are cached once the last chunk is sent.
+    if cache_key is not None:
+        if stream:
+            body = result_cache.cache_chunks(cache_key, body)
+        else:
+            result_cache.put(cache_key, body)
 
-    packedJSON += ' ] }'
-    # return '{ "terrain" : [ { "worldPos": { "x": 1, "y": 0, "z": 1 }, "verts" : [ {"x": 5.4, "y": 3.8, "z": 2.1 }, {"x": 1.2, "y": 0.52, "z": -2.1 } ], "indices" : [ 0, 1, 2 ] } ] }', 202
-    return packedJSON, 202
+    return Response(body, status=202, mimetype=mimetype)
+
+# Queue and batch statistics of the inference scheduler, and the result cache's hits and misses.
+@app.route("/Stats/", methods=['GET'])
+
+def stats():
+    return jsonify(dict(get_scheduler().stats(), result_cache=get_result_cache().stats()))
+
+# Loads the mesh corpus and the generator once, up front, so the first request doesn't pay for them.
+#       Prefork servers call this in every worker.
+def warm_up():
+    get_corpus().load()
+    if generate_from_model:
+        get_registry().warm(get_scheduler().model_path)
 
 # __name__ is a special variable that is used to ensure we only execute in the main file
 if __name__ == "__main__":
 
-    # Operation mode
-    op_mode = ""
-    if len(sys.argv) > 1:
-        op_mode = str(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Anvil terrain generation endpoint")
+    parser.add_argument("op_mode", nargs="?", default="", help="Operation mode, e.g. train")
+    parser.add_argument("--serve", choices=SERVE_MODES, default="dev",
+        help="dev: Flask's server, prefork: gunicorn worker processes, threaded: waitress thread pool")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Worker processes for --serve prefork")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="Worker threads for --serve threaded")
+    parser.add_argument("--latency", type=float, default=injected_latency,
+        help="Seconds of artificial latency added to every /Generate/ request (testing only)")
+    parser.add_argument("--latency-jitter", type=float, default=injected_jitter,
+        help="Up to this many extra random seconds of latency per request (testing only)")
+    parser.add_argument("--use-model", action="store_true",
+        help="Generate islands with the model rather than from the mesh corpus, this loads torch")
+    parser.add_argument("--max-batch-size", type=int,
+        default=int(os.environ.get("ANVIL_MAX_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE)))
+    parser.add_argument("--max-wait-ms", type=float,
+        default=float(os.environ.get("ANVIL_MAX_WAIT_MS", DEFAULT_MAX_WAIT * 1000)))
+    parser.add_argument("--max-queue-depth", type=int,
+        default=int(os.environ.get("ANVIL_MAX_QUEUE_DEPTH", DEFAULT_MAX_QUEUE_DEPTH)))
+    parser.add_argument("--result-cache-mb", type=float,
+        default=float(os.environ.get("ANVIL_RESULT_CACHE_MB", DEFAULT_MAX_BYTES / 2**20)),
+        help="Memory for cached responses to seeded graphs, 0 disables the cache")
+    parser.add_argument("--result-cache-disk-mb", type=float,
+        default=float(os.environ.get("ANVIL_RESULT_CACHE_DISK_MB", DEFAULT_DISK_MAX_BYTES / 2**20)),
+        help="Disk space for cached responses, in the --result-cache folder")
+    add_path_arguments(parser)
+    add_training_arguments(parser)
+    args = parser.parse_args()
+    paths = configure_paths_from_args(args)
 
+    # Operation mode
+    op_mode = args.op_mode
 
+    # Train and save the models, the server picks the new generator up on its next start.
     if (op_mode == "train"):
         print("Training Model ... ")
-
-
-    app.run(host="0.0.0.0", port=105)
-    
-
-
+        from Generator import train_models
+        train_models(args.headless, paths.island_set, args.log_file, args.log_every, args.plot_dir, args.num_workers,
+            args.metrics_dir, args.metrics_format, args.checkpoint_dir, args.checkpoint_every, args.resume,
+            args.intra_op_threads, args.inter_op_threads,
+            args.model, args.precision, args.channels_last, args.ingest_workers, args.world_size)
+        sys.exit(0)
+
+    generate_from_model = args.use_model
+    injected_latency = args.latency
+    injected_jitter = args.latency_jitter
+    if injected_latency > 0 or injected_jitter > 0:
+        print("Latency injection enabled:", injected_latency, "seconds, plus up to", injected_jitter, "seconds jitter")
+
+    # Batching limits of the inference scheduler, shared by all concurrent requests.
+    configure_scheduler(
+        model_path=paths.model_file,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        max_queue_depth=args.max_queue_depth,
+        precision=args.precision,
+        channels_last=args.channels_last
+    )
+
+    configure_corpus(paths.island_set, workers=args.ingest_workers)
+    configure_result_cache(int(args.result_cache_mb * 2**20), paths.result_cache, int(args.result_cache_disk_mb * 2**20))
+
+    serve(app, args.serve, args.host, args.port, args.workers, args.threads, on_start=warm_up)
@@ -0,0 +1,401 @@
+import argparse
+import time
+
+import torch
+
+from typing import Callable, Dict, Optional, Tuple
+
+
+# Micro-benchmarks for the hot paths of training and generation, comparing each against the
+#       implementation it replaced. Run all of them, or pick some by name:
+#           python Benchmarks.py
+#           python Benchmarks.py construct_4D_tensor
+#           python Benchmarks.py dc_precision
+#           python Benchmarks.py runtime
+#           python Benchmarks.py codec
+#           python Benchmarks.py island_cache
+#           python Benchmarks.py ingest
+#           python Benchmarks.py result_cache
+
+def time_call(function: Callable, repeats: int) -> float:
+    """Best time of repeats calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+def report(name: str, old_time: float, new_time: float):
+    print("{:<40} old {:>10.3f} ms   new {:>10.3f} ms   x{:.1f}".format(
+        name, old_time * 1000, new_time * 1000, old_time / new_time if new_time > 0 else float("inf")))
+
+
+# construct_4D_tensor
+def legacy_construct_4D_tensor(data, batch_size, num_channels, resolution):
+    # The original triple loop, building nested lists before calling torch.tensor.
+    data_lists = []
+    for i in range(0, batch_size):
+        batch = []
+        for j in range(0, num_channels):
+            channel_data = data[i][j]
+            channel_rows = []
+            current_val_index = 0
+            for y in range(0, resolution):
+                channel_cols = []
+                for x in range (0, resolution):
+                    channel_cols.append(channel_data[current_val_index])
+                    current_val_index+=1
+                channel_rows.append(channel_cols)
+            batch.append(channel_rows)
+        data_lists.append(batch)
+    return torch.tensor(data_lists)
+
+def bench_construct_4D_tensor():
+    from Generator import construct_4D_tensor
+
+    for batch_size, num_channels, resolution in [(32, 1, 32), (32, 3, 32)]:
+        channels = torch.rand(batch_size, 3, resolution * resolution)
+
+        # The old path was fed nested lists from sample_island_data.
+        channel_lists = [[row.numpy() for row in sample] for sample in channels]
+
+        old = legacy_construct_4D_tensor(channel_lists, batch_size, num_channels, resolution)
+        new = construct_4D_tensor(channels, batch_size, num_channels, resolution)
+        assert torch.equal(old, new)
+
+        report("construct_4D_tensor " + str((batch_size, num_channels, resolution)),
+            time_call(lambda: legacy_construct_4D_tensor(channel_lists, batch_size, num_channels, resolution), 3),
+            time_call(lambda: construct_4D_tensor(channels, batch_size, num_channels, resolution), 100))
+
+
+# DC models, fp32 against bf16
+def saved_activation_bytes(function: Callable) -> int:
+    """Bytes of the tensors autograd saves for the backward pass while function runs, the bulk
+        of a training step's memory beyond the weights.
+    """
+    total = [0]
+    def pack(tensor):
+        total[0] += tensor.numel() * tensor.element_size()
+        return tensor
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        function()
+    return total[0]
+
+def bench_dc_precision(batch_size: int = 32, num_channels: int = 1, resolution: int = 32):
+    import torch.nn as nn
+    from Generator import generate_4D_noise, vert_model_arguments
+    from Models import DCVertGenerator, DCVertDiscriminator, precision_autocast, to_channels_last
+
+    generator_kwargs, discriminator_kwargs = vert_model_arguments("dc", image_resolution=resolution, num_channels=num_channels)
+    true_data = torch.rand(batch_size, num_channels, resolution, resolution)
+    true_labels = torch.ones(batch_size, 1)
+    loss = nn.BCELoss()
+
+    def make_step(precision: str, channels_last: bool):
+        torch.manual_seed(0)
+        generator = DCVertGenerator(**generator_kwargs)
+        discriminator = DCVertDiscriminator(**discriminator_kwargs)
+        data = true_data
+        memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        if channels_last:
+            to_channels_last(generator)
+            to_channels_last(discriminator)
+            data = true_data.contiguous(memory_format=memory_format)
+        generator_optimizer = torch.optim.Adam(generator.parameters())
+        discriminator_optimizer = torch.optim.Adam(discriminator.parameters())
+
+        # One step of train_vert_gen's DC loop.
+        def forward():
+            with precision_autocast(precision):
+                generated_data = generator(generate_4D_noise(batch_size, num_channels, resolution).contiguous(memory_format=memory_format))
+                generator_loss = loss(discriminator(generated_data), true_labels)
+                discriminator_loss = (loss(discriminator(data), true_labels)
+                    + loss(discriminator(generated_data.detach()), torch.zeros(batch_size, 1))) / 2
+            return generator_loss, discriminator_loss
+
+        def step():
+            generator_optimizer.zero_grad()
+            discriminator_optimizer.zero_grad()
+            generator_loss, discriminator_loss = forward()
+            generator_loss.backward()
+            generator_optimizer.step()
+            discriminator_loss.backward()
+            discriminator_optimizer.step()
+
+        return step, forward
+
+    fp32_step, fp32_forward = make_step("fp32", False)
+    fp32_step()
+    fp32_time = time_call(fp32_step, 20)
+    fp32_bytes = saved_activation_bytes(fp32_forward)
+
+    for precision, channels_last in [("fp32", True), ("bf16", False), ("bf16", True)]:
+        step, forward = make_step(precision, channels_last)
+        step()
+        name = "dc train step " + precision + (" channels_last" if channels_last else "")
+        report(name, fp32_time, time_call(step, 20))
+        print("{:<40} fp32 {:>8.2f} MB   {:<4} {:>8.2f} MB saved activations".format(
+            "", fp32_bytes / 2**20, precision, saved_activation_bytes(forward) / 2**20))
+
+    if not torch.backends.mkldnn.is_available():
+        print("oneDNN isn't available, bf16 falls back to slow reference kernels")
+
+
+# Runtime exports, eager training exports against frozen TorchScript
+COLD_START = """
+import time
+start_time = time.perf_counter()
+import torch
+torch_time = time.perf_counter()
+from ModelRegistry import load_model
+from InferenceRuntime import make_noise, noise_shape
+model = load_model({path!r}).eval()
+with torch.inference_mode():
+    model(make_noise(1, noise_shape(model)))
+end_time = time.perf_counter()
+print(end_time - start_time, end_time - torch_time)
+"""
+
+def cold_start(path: str, repeats: int = 3) -> Tuple[float, float]:
+    """Best times a fresh interpreter takes to load the model at path and generate one batch,
+        in seconds. Once with importing torch, once from after it.
+    """
+    import os
+    import subprocess
+    import sys
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    total_times, load_times = [], []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", COLD_START.format(path=path)],
+            cwd=here, capture_output=True, text=True, check=True).stdout
+        total_time, load_time = output.strip().splitlines()[-1].split()
+        total_times.append(float(total_time))
+        load_times.append(float(load_time))
+    return min(total_times), min(load_times)
+
+def bench_runtime():
+    import os
+    import tempfile
+    from Checkpoint import export_model, export_torchscript
+    from Generator import vert_model_arguments
+    from InferenceRuntime import load_runtime, make_noise, noise_shape
+    from Models import DCVertGenerator, VertGenerator
+
+    directory = tempfile.mkdtemp()
+    for model_type, model_class in [("linear", VertGenerator), ("dc", DCVertGenerator)]:
+        generator_kwargs, _ = vert_model_arguments(model_type)
+        generator = model_class(**generator_kwargs).eval()
+
+        model_path = os.path.join(directory, model_type + ".model")
+        script_path = os.path.join(directory, model_type + ".ts")
+        export_model(generator, model_path, **generator_kwargs)
+        export_torchscript(generator, script_path)
+
+        (model_total, model_load), (script_total, script_load) = cold_start(model_path), cold_start(script_path)
+        report(model_type + " cold start, .model -> .ts", model_total, script_total)
+        report(model_type + " load + first batch, .model -> .ts", model_load, script_load)
+
+        scripted = load_runtime(script_path)
+        for batch_size in [1, 8, 64]:
+            noise = make_noise(batch_size, noise_shape(generator))
+            with torch.inference_mode():
+                assert torch.allclose(generator(noise), scripted(noise), atol=1e-5)
+                # A few calls first, TorchScript's executor optimizes the graph on its first runs.
+                for _ in range(3):
+                    scripted(noise)
+                report(model_type + " batch " + str(batch_size) + ", eager -> .ts",
+                    time_call(lambda: generator(noise), 50), time_call(lambda: scripted(noise), 50))
+
+
+# BitCodec, against the scalar helpers of Utils one value at a time
+def codec_island(num_verts: int = 1024):
+    """A random island of num_verts verts and two triangles per vert, including the float
+        values whose bits are easy to get wrong.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    verts = rng.normal(0, 10, (num_verts, 3))
+    verts.reshape(-1)[:6] = [0.0, -0.0, np.inf, -np.inf, 5e-324, np.nan]
+    indices = rng.integers(0, num_verts, num_verts * 6).astype(np.uint32)
+    return verts, indices
+
+def legacy_encode(verts, indices):
+    # MeshData.toBinary() before BitCodec, three float_to_bin() and bin_to_list() per vert.
+    from Utils import bin_to_list, float_to_bin, int_to_bin
+
+    vert_bin, vert_list_bin = [], []
+    for x, y, z in verts.tolist():
+        for value in (x, y, z):
+            bits = float_to_bin(value)
+            vert_bin.append(bits)
+            vert_list_bin.append(bin_to_list(bits))
+    index_bin = [int_to_bin(index) for index in indices.tolist()]
+    return vert_bin, vert_list_bin, index_bin
+
+def legacy_decode(vert_bin, index_bin):
+    # MeshData.fromBinary() before BitCodec.
+    from Utils import bin_to_float, bin_to_int
+    return [bin_to_float(bits) for bits in vert_bin], [bin_to_int(bits) for bits in index_bin]
+
+def bench_codec():
+    import numpy as np
+    from BitCodec import float_bit_planes, floats_to_strings, ints_to_bytes, ints_to_strings, strings_to_floats, strings_to_ints
+    from Utils import int_to_bytes
+
+    verts, indices = codec_island()
+    flat = verts.reshape(-1)
+
+    # Bit identical, NaN included, so compare raw bits rather than float values.
+    vert_bin, vert_list_bin, index_bin = legacy_encode(verts, indices)
+    assert floats_to_strings(flat) == vert_bin
+    assert float_bit_planes(flat).tolist() == vert_list_bin
+    assert ints_to_strings(indices) == index_bin
+
+    old_floats, old_indices = legacy_decode(vert_bin, index_bin)
+    assert np.array_equal(np.array(old_floats).view(np.uint64), strings_to_floats(vert_bin).view(np.uint64))
+    assert strings_to_ints(index_bin).tolist() == old_indices
+
+    assert [bytes(row) for row in ints_to_bytes(indices, 4)] == [int_to_bytes(index, 4) for index in indices.tolist()]
+
+    report("encode 1024 verts + indices", time_call(lambda: legacy_encode(verts, indices), 5),
+        time_call(lambda: (floats_to_strings(flat), float_bit_planes(flat), ints_to_strings(indices)), 20))
+    report("decode 1024 verts + indices", time_call(lambda: legacy_decode(vert_bin, index_bin), 5),
+        time_call(lambda: (strings_to_floats(vert_bin), strings_to_ints(index_bin)), 20))
+    report("int_to_bytes " + str(len(indices)) + " indices", time_call(lambda: [int_to_bytes(index, 4) for index in indices.tolist()], 5),
+        time_call(lambda: ints_to_bytes(indices, 4), 20))
+
+
+# Island loading, parsed OBJs against the memory-mapped IslandCache
+def bench_island_cache(directory: Optional[str] = None):
+    import os
+    import shutil
+    import tempfile
+    from AnvilConfig import get_paths
+    from IslandCache import load_island_cache
+    from IslandData import stack_island_channels
+    from Utils import load_island_data
+
+    directory = directory or get_paths().island_set
+
+    # Works on a copy, so neither the cache nor the edited file below touch the real island set.
+    with tempfile.TemporaryDirectory() as temp_dir:
+        copy = os.path.join(temp_dir, "islands/")
+        cache_dir = os.path.join(temp_dir, "cache")
+        shutil.copytree(directory, copy, ignore=shutil.ignore_patterns(".*"))
+
+        _, parsed = load_island_data(copy, use_cache=False)
+        cache = load_island_cache(copy, cache_dir)
+        assert torch.equal(stack_island_channels(parsed), stack_island_channels(cache.meshes()))
+
+        def parse():
+            _, islands = load_island_data(copy, use_cache=False)
+            return stack_island_channels(islands)
+
+        def cached():
+            return stack_island_channels(load_island_cache(copy, cache_dir).meshes())
+
+        def one_changed():
+            with open(os.path.join(copy, cache.names[0]), "a") as file:
+                file.write("\n")
+            return cached()
+
+        report("load + stack " + str(len(cache)) + " islands", time_call(parse, 5), time_call(cached, 20))
+        report("one island changed", time_call(parse, 5), time_call(one_changed, 5))
+
+
+# Uncached island parsing, serial against a process pool
+def bench_ingest(directory: Optional[str] = None, num_files: int = 2000):
+    import os
+    import shutil
+    import tempfile
+    from AnvilConfig import get_paths
+    from FileScanner import FileScanner
+    from Utils import iswavefront, load_island_data
+
+    directory = directory or get_paths().island_set
+    workers = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # A large island set, made of copies of the real one, plus a file that can't be parsed.
+        sources = sorted(f for f in os.listdir(directory) if f.endswith(".obj"))
+        for i in range(num_files):
+            shutil.copy(os.path.join(directory, sources[i % len(sources)]), os.path.join(temp_dir, "{:05d}.obj".format(i)))
+        with open(os.path.join(temp_dir, "malformed.obj"), "w") as file:
+            file.write("v 0 0 0\nf 1 2 3\n")
+
+        _, serial = load_island_data(temp_dir, use_cache=False, workers=1)
+        _, parallel = load_island_data(temp_dir, use_cache=False, workers=workers)
+        assert len(serial) == len(parallel) == num_files
+        assert all(torch.equal(torch.from_numpy(a.verts), torch.from_numpy(b.verts)) for a, b in zip(serial, parallel))
+
+        report("parse " + str(num_files) + " islands, " + str(workers) + " workers",
+            time_call(lambda: load_island_data(temp_dir, use_cache=False, workers=1), 2),
+            time_call(lambda: load_island_data(temp_dir, use_cache=False, workers=workers), 2))
+
+        # Rescanning for changes, as the corpus does on every refresh.
+        def legacy_scan():
+            # MeshCorpus._scan() before FileScanner.
+            return {f: os.path.getmtime(os.path.join(temp_dir, f)) for f in os.listdir(temp_dir)
+                if os.path.isfile(os.path.join(temp_dir, f)) and iswavefront(f)}
+
+        scanner = FileScanner(temp_dir)
+        os.utime(temp_dir, ns=(0, 0)) # Old enough that the listing is trusted
+        assert sorted(scanner.scan()) == sorted(legacy_scan())
+        report("rescan " + str(num_files + 1) + " islands", time_call(legacy_scan, 5), time_call(scanner.scan, 5))
+
+
+# /Generate/ for a seeded graph, generated against served from the result cache
+def bench_result_cache(num_nodes: int = 20):
+    import contextlib
+    import io
+    import json
+    from AnvilGenerator import app
+    from LoadTest import make_graph
+    from ResultCache import configure_result_cache
+
+    client = app.test_client()
+    payload = json.dumps(dict(make_graph(num_nodes), seed=1))
+
+    def post():
+        # generate() prints every node, keep that out of the timings.
+        with contextlib.redirect_stdout(io.StringIO()):
+            return client.post("/Generate/", data=payload, content_type="application/json").get_data()
+
+    configure_result_cache(0)
+    generated = post()
+    assert post() == generated
+
+    cache = configure_result_cache()
+    post()
+    assert post() == generated and cache.hits == 1
+
+    configure_result_cache(0)
+    old_time = time_call(post, 10)
+    configure_result_cache()
+    post()
+    report("/Generate/ " + str(num_nodes) + " nodes, seeded", old_time, time_call(post, 10))
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "construct_4D_tensor": bench_construct_4D_tensor,
+    "dc_precision": bench_dc_precision,
+    "runtime": bench_runtime,
+    "codec": bench_codec,
+    "island_cache": bench_island_cache,
+    "ingest": bench_ingest,
+    "result_cache": bench_result_cache,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Anvil micro-benchmarks")
+    parser.add_argument("names", nargs="*", help="Benchmarks to run, all of them by default: " + ", ".join(BENCHMARKS))
+    args = parser.parse_args()
+
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark " + name)
+
+    for name in args.names or BENCHMARKS.keys():
+        BENCHMARKS[name]()
@@ -0,0 +1,136 @@
+import numpy as np
+
+from typing import List, Optional, Sequence
+
+
+# Batch codec for the bit representations of mesh data, whole vertex and index arrays at a time.
+#       Each function is the array counterpart of a scalar helper in Utils, and gives bit-identical
+#       results, through NumPy dtype views and np.packbits / np.unpackbits rather than struct, format
+#       strings and per character int() calls:
+#           float_to_bin  ->  floats_to_strings,  float_bit_planes
+#           bin_to_float  ->  strings_to_floats,  bit_planes_to_floats
+#           int_to_bin    ->  ints_to_strings,    int_bit_planes
+#           bin_to_int    ->  strings_to_ints,    bit_planes_to_ints
+#           bin_to_list   ->  strings_to_bit_planes
+#           int_to_bytes  ->  ints_to_bytes
+#       A bit plane array holds one value per row, its bits as 0/1 uint8s, most significant first.
+
+FLOAT_BITS = 64 # IEEE 754 binary64
+INDEX_BITS = 16 # Minimum width of int_to_bin()
+
+
+# Bit planes and strings
+def bit_planes_to_strings(planes: np.ndarray) -> List[str]:
+    # Rows of 0/1 to strings of '0'/'1' characters, without a per bit Python loop.
+    planes = np.asarray(planes, dtype=np.uint8)
+    chars = np.ascontiguousarray(planes) + ord('0')
+    return chars.view('S' + str(planes.shape[1])).reshape(-1).astype(str).tolist()
+
+def strings_to_bit_planes(strings: Sequence[str], bits: Optional[int] = None) -> np.ndarray:
+    """Strings of '0'/'1' characters to rows of bits, as bin_to_list() does for each string.
+        Shorter strings are read as if zero padded on the left, as int(string, 2) reads them.
+    Args:
+        bits: Bits per row, the length of the longest string if None
+    """
+    chars = np.array(strings, dtype='S')
+    if bits is None:
+        bits = chars.dtype.itemsize
+    if len(chars) == 0:
+        return np.zeros((0, bits), dtype=np.uint8)
+
+    if chars.dtype.itemsize != bits or (np.char.str_len(chars) != bits).any():
+        if chars.dtype.itemsize > bits:
+            raise ValueError("Binary strings longer than " + str(bits) + " bits")
+        chars = np.char.rjust(chars, bits, b'0')
+
+    planes = np.ascontiguousarray(chars, dtype='S' + str(bits)).reshape(-1).view(np.uint8).reshape(-1, bits) - ord('0')
+    if planes.max() > 1:
+        raise ValueError("Binary strings may only hold 0 and 1")
+    return planes
+
+def pad_rows(rows: np.ndarray, max_size: int) -> np.ndarray:
+    # Zero pad up to max_size rows, longer inputs are left as they are.
+    if len(rows) >= max_size:
+        return rows
+    padding = np.zeros((max_size - len(rows),) + rows.shape[1:], dtype=rows.dtype)
+    return np.concatenate([rows, padding])
+
+
+# Floats
+def float_bit_planes(values: np.ndarray) -> np.ndarray:
+    # Same bits as float_to_bin(), one row of 64 per value.
+    big_endian = np.ascontiguousarray(values, dtype='>f8').reshape(-1)
+    return np.unpackbits(big_endian.view(np.uint8).reshape(-1, 8), axis=1)
+
+def bit_planes_to_floats(planes: np.ndarray) -> np.ndarray:
+    packed = np.packbits(np.asarray(planes, dtype=np.uint8).reshape(-1, FLOAT_BITS), axis=1)
+    return packed.view('>f8').reshape(-1).astype(np.float64)
+
+def floats_to_strings(values: np.ndarray) -> List[str]:
+    """float_to_bin() of every value."""
+    return bit_planes_to_strings(float_bit_planes(values))
+
+def strings_to_floats(strings: Sequence[str]) -> np.ndarray:
+    """bin_to_float() of every string, as a float64 array."""
+    return bit_planes_to_floats(strings_to_bit_planes(strings, FLOAT_BITS))
+
+
+# Integers
+def _unsigned(values) -> np.ndarray:
+    values = np.asarray(values).reshape(-1)
+    if len(values) == 0:
+        return values.astype(np.uint64)
+    if values.dtype.kind == 'i' and values.min() < 0:
+        raise ValueError("Only non negative integers have a binary form")
+    if values.dtype.kind not in 'iub':
+        raise ValueError("Expected integers, got " + str(values.dtype))
+    return values.astype(np.uint64)
+
+def int_bit_planes(values, bits: int = INDEX_BITS) -> np.ndarray:
+    """Fixed width rows of bits, one per value, as int_to_bin() for values below 2**bits."""
+    values = _unsigned(values)
+    if bits < 64 and len(values) and values.max() >> np.uint64(bits):
+        raise ValueError("Values don't fit in " + str(bits) + " bits")
+
+    planes = np.unpackbits(values.astype('>u8').view(np.uint8).reshape(-1, 8), axis=1)
+    return planes[:, 64 - bits:]
+
+def bit_planes_to_ints(planes: np.ndarray) -> np.ndarray:
+    planes = np.asarray(planes, dtype=np.uint8)
+    bits = planes.shape[1]
+    if bits > 64:
+        raise ValueError("At most 64 bits per value")
+
+    padded = np.zeros((len(planes), 64), dtype=np.uint8)
+    padded[:, 64 - bits:] = planes
+    return np.packbits(padded, axis=1).view('>u8').reshape(-1).astype(np.int64)
+
+def ints_to_strings(values) -> List[str]:
+    """int_to_bin() of every value: at least 16 digits, more for values that need them."""
+    values = _unsigned(values)
+    if len(values) == 0 or values.max() <= 0xFFFF:
+        return bit_planes_to_strings(int_bit_planes(values, INDEX_BITS))
+
+    # Strip each 64 bit string down to its own width.
+    planes = int_bit_planes(values, 64)
+    leading_zeros = np.where(planes.any(axis=1), planes.argmax(axis=1), 64)
+    starts = np.minimum(leading_zeros, 64 - INDEX_BITS).tolist()
+    return [string[start:] for string, start in zip(bit_planes_to_strings(planes), starts)]
+
+def strings_to_ints(strings: Sequence[str]) -> np.ndarray:
+    """bin_to_int() of every string, as an int64 array."""
+    if len(strings) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return bit_planes_to_ints(strings_to_bit_planes(strings))
+
+def ints_to_bytes(values, length: int) -> np.ndarray:
+    """int_to_bytes() of every value, as rows of length big endian bytes.
+        As there, values are cut to their low length bytes.
+    """
+    big_endian = _unsigned(values).astype('>u8').view(np.uint8).reshape(-1, 8)
+    if length <= 8:
+        return np.ascontiguousarray(big_endian[:, 8 - length:])
+
+    padded = np.zeros((len(big_endian), length), dtype=np.uint8)
+    padded[:, length - 8:] = big_endian
+    return padded
@@ -0,0 +1,245 @@
+import copy
+import importlib.util
+import json
+import os
+import random
+import re
+import warnings
+
+from os import listdir
+from os.path import join
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from typing import Dict, Optional
+
+from Models import EvenGenerator, VertGenerator, DCVertGenerator
+from Models import EvenDiscriminator, Discriminator, DCVertDiscriminator
+from InferenceRuntime import METADATA_FILE, noise_shape, runtime_metadata
+
+
+# Training checkpoints and inference exports.
+#       A checkpoint holds everything needed to carry on training where it stopped: model and
+#       optimizer state_dicts, the step counter and every RNG state. An export holds just a model's
+#       class name, constructor arguments and weights, so it loads with torch.load(weights_only=True)
+#       rather than unpickling arbitrary classes. A runtime export goes further, and traces a
+#       generator into a frozen TorchScript or ONNX graph that InferenceRuntime runs without Models.
+#           python Checkpoint.py vert_gen.model vert_gen.ts
+#           python Checkpoint.py vert_gen.model vert_gen.onnx
+
+CHECKPOINT_PATTERN = re.compile(r"^(\w+)_checkpoint_(\d+)\.pt$")
+EXPORT_FORMAT = "anvil-model"
+EXPORT_VERSION = 1
+
+# The only classes an export can name.
+MODEL_CLASSES = {
+    cls.__name__: cls for cls in [
+        EvenGenerator, VertGenerator, DCVertGenerator,
+        EvenDiscriminator, Discriminator, DCVertDiscriminator
+    ]
+}
+
+
+def torch_load(path: str, weights_only: bool):
+    try:
+        return torch.load(path, map_location="cpu", weights_only=weights_only)
+    except TypeError:
+        # Older torch releases have no weights_only argument.
+        return torch.load(path, map_location="cpu")
+
+def save_atomic(obj, path: str):
+    # Write next to the target and swap it in, so a crash mid-write never leaves a broken file.
+    temp_path = path + ".tmp"
+    torch.save(obj, temp_path)
+    os.replace(temp_path, path)
+
+
+# RNG
+def get_rng_state() -> Dict:
+    return {
+        "torch": torch.get_rng_state(),
+        "numpy": np.random.get_state(),
+        "python": random.getstate()
+    }
+
+def set_rng_state(state: Dict):
+    torch.set_rng_state(state["torch"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
+
+
+# CHECKPOINTS
+def checkpoint_path(directory: str, name: str, step: int) -> str:
+    return join(directory, name + "_checkpoint_" + str(step) + ".pt")
+
+def list_checkpoints(directory: str, name: str) -> Dict[int, str]:
+    """Returns the checkpoints of the named run in directory, by step."""
+    if not os.path.isdir(directory):
+        return {}
+
+    found = {}
+    for file in listdir(directory):
+        match = CHECKPOINT_PATTERN.match(file)
+        if match and match.group(1) == name:
+            found[int(match.group(2))] = join(directory, file)
+    return found
+
+def latest_checkpoint(directory: str, name: str) -> Optional[str]:
+    checkpoints = list_checkpoints(directory, name)
+    if not checkpoints:
+        return None
+    return checkpoints[max(checkpoints)]
+
+def save_checkpoint(directory: str, name: str, step: int,
+    generator: nn.Module, discriminator: nn.Module,
+    generator_optimizer: torch.optim.Optimizer, discriminator_optimizer: torch.optim.Optimizer,
+    extra: Optional[Dict] = None,
+    keep: int = 3
+) -> str:
+    """Writes a checkpoint after the given step, and deletes all but the newest keep checkpoints.
+    Args:
+        directory: Folder the checkpoints are kept in
+        name: Name of the training run, e.g. vert
+        step: The last completed training step
+        extra: Any other state to store, e.g. accumulated metrics
+        keep: Number of checkpoints kept, None keeps all of them
+    Returns:
+        The path of the new checkpoint.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    path = checkpoint_path(directory, name, step)
+    save_atomic({
+        "step": step,
+        "generator": generator.state_dict(),
+        "discriminator": discriminator.state_dict(),
+        "generator_optimizer": generator_optimizer.state_dict(),
+        "discriminator_optimizer": discriminator_optimizer.state_dict(),
+        "rng": get_rng_state(),
+        "extra": extra or {}
+    }, path)
+
+    if keep is not None:
+        checkpoints = list_checkpoints(directory, name)
+        for old_step in sorted(checkpoints)[:-keep]:
+            os.remove(checkpoints[old_step])
+
+    return path
+
+def load_checkpoint(path: str,
+    generator: nn.Module, discriminator: nn.Module,
+    generator_optimizer: torch.optim.Optimizer, discriminator_optimizer: torch.optim.Optimizer
+) -> Dict:
+    """Restores models, optimizers and RNG states from a checkpoint, in place.
+    Returns:
+        The checkpoint, for its step and extra state.
+    """
+    # Checkpoints are our own files, and hold NumPy's RNG state, so they're fully unpickled.
+    checkpoint = torch_load(path, weights_only=False)
+
+    generator.load_state_dict(checkpoint["generator"])
+    discriminator.load_state_dict(checkpoint["discriminator"])
+    generator_optimizer.load_state_dict(checkpoint["generator_optimizer"])
+    discriminator_optimizer.load_state_dict(checkpoint["discriminator_optimizer"])
+    set_rng_state(checkpoint["rng"])
+
+    return checkpoint
+
+
+# EXPORTS
+def export_model(model: nn.Module, path: str, **init_kwargs):
+    """Saves a model for inference only, as its class name, constructor arguments and weights.
+    Args:
+        init_kwargs: The arguments the model was constructed with, e.g. input_length=7
+    """
+    if type(model).__name__ not in MODEL_CLASSES:
+        raise ValueError("Can't export " + type(model).__name__ + ", it isn't one of " + ", ".join(MODEL_CLASSES))
+
+    save_atomic({
+        "format": EXPORT_FORMAT,
+        "version": EXPORT_VERSION,
+        "class": type(model).__name__,
+        "kwargs": init_kwargs,
+        "state_dict": model.state_dict()
+    }, path)
+
+def is_export(data) -> bool:
+    return isinstance(data, dict) and data.get("format") == EXPORT_FORMAT
+
+def model_from_export(data: Dict) -> nn.Module:
+    if data.get("version") != EXPORT_VERSION:
+        raise ValueError("Unsupported model export version " + str(data.get("version")))
+    if data["class"] not in MODEL_CLASSES:
+        raise ValueError("Unknown model class " + str(data["class"]))
+
+    model = MODEL_CLASSES[data["class"]](**data["kwargs"])
+    model.load_state_dict(data["state_dict"])
+    return model.eval()
+
+def load_export(path: str) -> nn.Module:
+    """Loads a model saved with export_model(), in eval mode."""
+    return model_from_export(torch_load(path, weights_only=True))
+
+
+# RUNTIME EXPORTS
+def trace_example(model: nn.Module, batch_size: int) -> torch.Tensor:
+    # Tracing records the ops one forward pass runs, any noise of the right shape will do.
+    return torch.zeros((batch_size,) + noise_shape(model))
+
+def export_torchscript(model: nn.Module, path: str, batch_size: int = 1):
+    """Traces a generator into a frozen TorchScript graph, with its weights inlined as constants
+        and conv / batch norm pairs folded together, and saves it for InferenceRuntime.
+    Args:
+        batch_size: Batch size of the trace, the graph runs at any batch size.
+    """
+    model = copy.deepcopy(model).float().eval()
+    metadata = runtime_metadata(type(model).__name__, noise_shape(model))
+
+    # TorchScript is deprecated in newer torch releases, and says so on every call.
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.simplefilter("ignore", FutureWarning)
+        traced = torch.jit.trace(model, trace_example(model, batch_size))
+        # Freezing runs the conv / batch norm folding. The oneDNN rewrites of optimize_for_inference
+        #       don't survive saving, InferenceRuntime applies them as the graph is loaded.
+        frozen = torch.jit.freeze(traced)
+
+        temp_path = path + ".tmp"
+        torch.jit.save(frozen, temp_path, _extra_files={METADATA_FILE: json.dumps(metadata)})
+    os.replace(temp_path, path)
+
+def export_onnx(model: nn.Module, path: str, batch_size: int = 1):
+    """Exports a generator to ONNX for onnxruntime, with a dynamic batch dimension.
+        Its metadata is written next to it, to <path>.json.
+    """
+    # torch.onnx.export imports onnx itself, check for it up front for a clearer error.
+    if importlib.util.find_spec("onnx") is None:
+        raise ImportError("ONNX export needs onnx, install it with: pip install onnx")
+
+    model = copy.deepcopy(model).float().eval()
+    with torch.no_grad():
+        torch.onnx.export(model, (trace_example(model, batch_size),), path,
+            input_names=["noise"], output_names=["verts"],
+            dynamic_axes={"noise": {0: "batch"}, "verts": {0: "batch"}})
+
+    with open(path + ".json", "w") as file:
+        json.dump(runtime_metadata(type(model).__name__, noise_shape(model)), file)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exports a trained generator for InferenceRuntime")
+    parser.add_argument("model", help="Generator exported by training, e.g. vert_gen.model")
+    parser.add_argument("output", help="Runtime artifact, TorchScript for .ts or ONNX for .onnx")
+    args = parser.parse_args()
+
+    from ModelRegistry import load_model
+
+    generator = load_model(args.model)
+    if args.output.endswith(".onnx"):
+        export_onnx(generator, args.output)
+    else:
+        export_torchscript(generator, args.output)
+    print("Exported", type(generator).__name__, "from", args.model, "to", args.output)
@@ -0,0 +1,234 @@
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+
+from typing import Dict, List, Optional
+
+from AnvilConfig import add_path_arguments, configure_paths, configure_paths_from_args, get_paths
+from IslandCache import load_island_cache
+from TrainingArguments import PRECISIONS, VERT_MODEL_TYPES
+
+
+# Data parallel GAN training on CPU boxes, over torch.distributed's gloo backend.
+#       Every process holds a full replica of the generator and discriminator and trains on its own
+#       random batches. After each backward pass the gradients are averaged across the processes,
+#       so every replica takes the same optimizer step and they stay identical.
+#           python Distributed.py --workers 4 --intra-op-threads 2
+#           python Distributed.py --scaling-report 1 2 4 --steps 500
+
+DEFAULT_PORT = 29500
+
+# The seed this process' replica was started with, None outside distributed training.
+_replica_seed: Optional[int] = None
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+def is_main_process() -> bool:
+    """True outside distributed training, and in rank 0 within it."""
+    return not is_distributed() or dist.get_rank() == 0
+
+def configure_threads(intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None):
+    """Sets this process' torch thread pools, None leaves torch's default."""
+    if intra_op_threads is not None:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads is not None:
+        # Can only be set once, before any inter-op parallel work has started.
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            pass
+
+def seed_replica(seed: int, step: int = 0):
+    """Seeds torch, NumPy and random differently in every replica, so each draws its own batches and noise.
+        Each step gets its own seeds too, for reseeding after a resume.
+    """
+    global _replica_seed
+    _replica_seed = seed
+    replica_seed = seed + step * dist.get_world_size() + dist.get_rank()
+    torch.manual_seed(replica_seed)
+    np.random.seed(replica_seed)
+    random.seed(replica_seed)
+
+def reseed_replica(step: int):
+    """Reseeds this replica for the given step, after a checkpoint restored rank 0's RNG state into every replica."""
+    if is_distributed() and _replica_seed is not None:
+        seed_replica(_replica_seed, step)
+
+def broadcast_parameters(model: nn.Module):
+    """Copies rank 0's weights to every other replica."""
+    if not is_distributed():
+        return
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        dist.broadcast(tensor.data, src=0)
+
+def average_gradients(model: nn.Module):
+    """Averages the model's gradients across all processes, with one all_reduce over a flat buffer."""
+    if not is_distributed():
+        return
+
+    grads = [p.grad for p in model.parameters() if p.grad is not None]
+    if not grads:
+        return
+
+    flat = torch.cat([g.reshape(-1) for g in grads])
+    dist.all_reduce(flat, op=dist.ReduceOp.SUM)
+    flat /= dist.get_world_size()
+
+    offset = 0
+    for g in grads:
+        g.copy_(flat[offset:offset + g.numel()].view_as(g))
+        offset += g.numel()
+
+
+def _train_worker(rank: int, world_size: int, port: int, train_kwargs: Dict,
+    intra_op_threads: Optional[int], inter_op_threads: Optional[int], seed: int,
+    exports: Dict[str, Optional[str]], paths: Dict, log_kwargs: Dict, results):
+    from Generator import VERT_TRAINING_STEPS, train_vert_gen, vert_model_arguments
+    from Checkpoint import export_model
+    from TrainingLog import MetricsAccumulator, TrainingLog
+
+    # Spawned processes start from scratch, they take the launcher's paths rather than resolving their own.
+    configure_paths(**paths)
+
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    configure_threads(intra_op_threads, inter_op_threads)
+
+    # Every replica draws different batches and noise.
+    seed_replica(seed)
+
+    # Only rank 0 logs to disk, writes checkpoints and exports. The others log to memory.
+    if rank == 0:
+        training_log = TrainingLog(**log_kwargs)
+    else:
+        training_log = TrainingLog(None, log_kwargs.get("log_every", 100), None)
+    train_kwargs = dict(train_kwargs)
+    train_kwargs["headless"] = True
+    train_kwargs["training_log"] = training_log
+    metrics = MetricsAccumulator(["g_loss", "d_loss"], capacity=train_kwargs.get("training_steps", VERT_TRAINING_STEPS))
+    train_kwargs["metrics"] = metrics
+
+    # Closed before the process exits, so the plot writer finishes the last plots.
+    try:
+        dist.barrier()
+        start_time = time.time()
+        generator, discriminator = train_vert_gen(**train_kwargs)
+        dist.barrier()
+        elapsed = time.time() - start_time
+    finally:
+        training_log.close()
+
+    if rank == 0:
+        generator_kwargs, discriminator_kwargs = vert_model_arguments(train_kwargs.get("model_type", "linear"),
+            train_kwargs.get("max_int", 128), train_kwargs.get("image_resolution", 32), train_kwargs.get("num_channels", 1))
+        if exports.get("generator") is not None:
+            export_model(generator, exports["generator"], **generator_kwargs)
+        if exports.get("discriminator") is not None:
+            export_model(discriminator, exports["discriminator"], **discriminator_kwargs)
+        if exports.get("metrics") is not None:
+            metrics.save(exports["metrics"])
+
+        steps = train_kwargs.get("training_steps")
+        results.put({"workers": world_size, "seconds": elapsed, "steps": steps})
+
+    dist.destroy_process_group()
+
+def launch(world_size: int, train_kwargs: Dict,
+    intra_op_threads: Optional[int] = None,
+    inter_op_threads: Optional[int] = None,
+    seed: int = 0,
+    port: int = DEFAULT_PORT,
+    export_path: Optional[str] = None,
+    discriminator_export_path: Optional[str] = None,
+    metrics_path: Optional[str] = None,
+    log_file: Optional[str] = "training_log.jsonl",
+    log_every: int = 100,
+    plot_dir: Optional[str] = "plots"
+) -> Dict:
+    """Trains the vert GAN across world_size processes.
+    Args:
+        train_kwargs: Arguments for train_vert_gen, batch_size is per process
+        intra_op_threads: Torch threads per process for a single op
+        inter_op_threads: Torch threads per process running independent ops
+        export_path: Where rank 0 exports the trained generator, None skips the export
+        discriminator_export_path: Where rank 0 exports the trained discriminator, None skips the export
+        metrics_path: Where rank 0 saves its per-step losses, npz or csv by extension, None skips them
+        log_file, log_every, plot_dir: Rank 0's TrainingLog, the other ranks don't log to disk
+    Returns:
+        Rank 0's timing: workers, seconds and steps.
+    """
+    # Bring the island cache up to date once, here, rather than in every process at the same time.
+    load_island_cache(train_kwargs.get("island_set_path"), workers=train_kwargs.get("ingest_workers", 1))
+
+    context = mp.get_context("spawn")
+    results = context.SimpleQueue()
+    mp.start_processes(_train_worker,
+        args=(world_size, port, train_kwargs, intra_op_threads, inter_op_threads, seed,
+            {"generator": export_path, "discriminator": discriminator_export_path, "metrics": metrics_path}, get_paths().as_dict(),
+            {"path": log_file, "log_every": log_every, "plot_dir": plot_dir}, results),
+        nprocs=world_size, start_method="spawn")
+    return results.get()
+
+def scaling_report(worker_counts: List[int], train_kwargs: Dict,
+    intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None, port: int = DEFAULT_PORT):
+    """Trains the same number of steps at every worker count and prints steps/second for each."""
+    batch_size = train_kwargs.get("batch_size", 32)
+    print("{:>8} {:>10} {:>12} {:>14} {:>9}".format("workers", "seconds", "steps/s", "samples/s", "speedup"))
+
+    baseline = None
+    for workers in worker_counts:
+        result = launch(workers, train_kwargs, intra_op_threads, inter_op_threads, port=port)
+        steps_per_second = result["steps"] / result["seconds"]
+        if baseline is None:
+            baseline = steps_per_second
+
+        print("{:>8} {:>10.2f} {:>12.1f} {:>14.1f} {:>8.2f}x".format(
+            workers, result["seconds"], steps_per_second, steps_per_second * batch_size * workers, steps_per_second / baseline))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Data parallel vert GAN training over gloo")
+    parser.add_argument("--workers", type=int, default=2, help="Training processes")
+    parser.add_argument("--intra-op-threads", type=int, default=None, help="Torch threads per process for a single op")
+    parser.add_argument("--inter-op-threads", type=int, default=None, help="Torch threads per process across ops")
+    parser.add_argument("--steps", type=int, default=10001)
+    parser.add_argument("--batch-size", type=int, default=32, help="Batch size per process")
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", choices=VERT_MODEL_TYPES, default="linear", help="Vert GAN to train, linear or DC (convolutional)")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32", help="bf16 trains under CPU autocast")
+    parser.add_argument("--channels-last", action="store_true", help="Run the DC models in channels_last memory format")
+    parser.add_argument("--ingest-workers", type=int, default=os.cpu_count() or 1, help="Processes parsing island .obj files that aren't cached yet")
+    parser.add_argument("--scaling-report", type=int, nargs="+", default=None,
+        help="Worker counts to time, e.g. 1 2 4, instead of a training run")
+    add_path_arguments(parser)
+    args = parser.parse_args()
+    paths = configure_paths_from_args(args)
+
+    train_kwargs = {
+        "training_steps": args.steps,
+        "batch_size": args.batch_size,
+        "island_set_path": paths.island_set,
+        "model_type": args.model,
+        "precision": args.precision,
+        "channels_last": args.channels_last,
+        "ingest_workers": args.ingest_workers,
+    }
+
+    if args.scaling_report is not None:
+        scaling_report(args.scaling_report, train_kwargs, args.intra_op_threads, args.inter_op_threads, args.port)
+    else:
+        train_kwargs.update({"checkpoint_dir": args.checkpoint_dir, "resume": args.resume})
+        result = launch(args.workers, train_kwargs, args.intra_op_threads, args.inter_op_threads,
+            port=args.port, export_path=paths.model_path("vert_gen.model"))
+        print("Trained", result["steps"], "steps on", result["workers"], "workers in", str(result["seconds"]), "seconds")
@@ -0,0 +1,89 @@
+import os
+import time
+
+from os.path import join, splitext
+
+from typing import Dict, List, Sequence, Tuple
+
+
+# Recursive listing of the files in a folder with given extensions, through os.scandir.
+#       Directory listings are kept between scans, and a directory whose mtime hasn't changed isn't
+#       listed again, only its files are stat'ed, for their sizes and mtimes. The stats of the last
+#       scan are kept too, so the island cache and the mesh corpus share one scan per reload.
+#       Hidden files and folders, e.g. .island_cache, are skipped.
+
+# A listing is only trusted once its directory's mtime is this much older than the listing,
+#       as a file added within the same mtime tick wouldn't change it.
+RACY_MTIME_NS = 2 * 10**9
+
+
+def has_extension(filename: str, extensions: Sequence[str]) -> bool:
+    # The last extension only, case insensitive, so "island.v2.OBJ" is a wavefront file.
+    return splitext(filename)[1].lower() in extensions
+
+
+class FileScanner:
+
+    def __init__(self, root: str, extensions: Sequence[str] = (".obj",), recursive: bool = True):
+        """
+        Args:
+            root: Folder to scan
+            extensions: Lower case extensions of the files to list, dot included
+            recursive: Also scan the folders inside root
+        """
+        self.root = root
+        self.extensions = tuple(extensions)
+        self.recursive = recursive
+
+        # Path of each directory -> (its mtime, when it was listed, matching file names, subdirectory names)
+        self._listings: Dict[str, Tuple[int, int, List[str], List[str]]] = {}
+        self.stats: Dict[str, os.stat_result] = {}
+
+    def scan(self) -> Dict[str, os.stat_result]:
+        """The stats of every matching file, by path relative to root with / separators, in name order."""
+        stats: Dict[str, os.stat_result] = {}
+        listings: Dict[str, Tuple[int, int, List[str], List[str]]] = {}
+        self._scan_directory(self.root, "", stats, listings)
+
+        # Directories that are gone drop out of the listings.
+        self._listings = listings
+        self.stats = dict(sorted(stats.items()))
+        return self.stats
+
+    def _scan_directory(self, path: str, prefix: str, stats: Dict[str, os.stat_result], listings: Dict):
+        mtime = os.stat(path).st_mtime_ns
+        listing = self._listings.get(path)
+
+        if listing is not None and listing[0] == mtime and listing[1] - mtime > RACY_MTIME_NS:
+            files, directories = listing[2], listing[3]
+            for name in files:
+                try:
+                    stats[prefix + name] = os.stat(join(path, name))
+                except FileNotFoundError:
+                    pass
+        else:
+            listed = time.time_ns()
+            files, directories = [], []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir():
+                        directories.append(entry.name)
+                    elif entry.is_file() and has_extension(entry.name, self.extensions):
+                        files.append(entry.name)
+                        stats[prefix + entry.name] = entry.stat()
+            listing = (mtime, listed, files, directories)
+
+        listings[path] = listing
+        if self.recursive:
+            for name in directories:
+                self._scan_directory(join(path, name), prefix + name + "/", stats, listings)
+
+    @staticmethod
+    def changes(old: Dict[str, os.stat_result], new: Dict[str, os.stat_result]) -> Tuple[List[str], List[str]]:
+        """Files added or modified, by size or mtime, and files removed between two scans."""
+        changed = [name for name, stat in new.items()
+            if name not in old or old[name].st_mtime_ns != stat.st_mtime_ns or old[name].st_size != stat.st_size]
+        removed = [name for name in old if name not in new]
+        return changed, removed
@@ -5,16 +5,27 @@ import numpy as np
 
 from typing import Optional
 import math
+import os
 import random
 from random import choice, randrange
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 from Utils import load_island_data, MeshData
+from AnvilConfig import add_path_arguments, configure_paths_from_args, get_paths
+from IslandData import IslandDataset, endless, make_loader, make_island_loader
+
+from torch.utils.data import IterableDataset
 
 from Models import *
+from TrainingLog import MetricsAccumulator, TrainingLog
+from Checkpoint import export_model, export_torchscript, latest_checkpoint, load_checkpoint, save_checkpoint
+from Distributed import average_gradients, broadcast_parameters, configure_threads, is_main_process, launch, reseed_replica
+from ModelRegistry import load_model
+from TrainingArguments import VERT_MODEL_TYPES, add_training_arguments
 
-import matplotlib.pyplot as plt
 
+EVEN_TRAINING_STEPS = 500
+VERT_TRAINING_STEPS = 10001
 
 # Creates a binary list from any integer
 def create_binary_list_from_int(number: int) -> List[int]:
@@ -48,10 +59,9 @@ def sample_island_data(labels, islands, batch_size):
     lab_channels = []
     isl = []
 
-    # Grab N samples from the true distribution
-    for j in range(0, batch_size):
-        # Choose random number not already chosen
-        sample = choice([i for i in range(0,len(islands)) if i not in indices])
+    # Grab N distinct samples from the true distribution, at most every island once.
+    #       Training draws the same batches straight into tensors through IslandDataset.
+    for sample in random.sample(range(len(islands)), min(batch_size, len(islands))):
         indices.append(sample)
 
         channels = []
@@ -64,10 +74,6 @@ def sample_island_data(labels, islands, batch_size):
         # isl.append(islands[sample].verts_vector)
         isl.append(islands[sample].x_channel)
 
-        # Check if there are still samples remaining:
-        if len(indices) >= len(islands):
-            break
-
     # Once N samples are collected, return.
     return lab, isl, lab_channels
 
@@ -87,12 +93,31 @@ def generate_even_data(max_int: int, batch_size: int=16) -> Tuple[List[int], Lis
 
     return labels, data
 
+# Endless stream of even number training batches, each already shaped for the discriminator.
+class EvenDataStream(IterableDataset):
+
+    def __init__(self, max_int: int, batch_size: int):
+        super(EvenDataStream, self).__init__()
+        self.max_int = max_int
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        while True:
+            labels, data = generate_even_data(self.max_int, batch_size=self.batch_size)
+            yield torch.tensor(labels).unsqueeze(1).float(), torch.tensor(data).unsqueeze(1).float()
+
 # Linear, Random Numbers Train function
 def train_even_gen(max_int: int = 128,
     batch_size: int = 16,
-    training_steps: int = 500,
+    training_steps: int = EVEN_TRAINING_STEPS,
     learning_rate: float = 0.001,
     print_output_every_n_steps: int = 10,
+    num_workers: int = 0,
+    pin_memory: bool = False,
+    prefetch_factor: int = 2,
+    headless: bool = False,
+    training_log: Optional[TrainingLog] = None,
+    metrics: Optional[MetricsAccumulator] = None,
 ) -> Tuple[nn.Module]:
     """Trains the even GAN
     Args:
@@ -102,6 +127,13 @@ def train_even_gen(max_int: int = 128,
         training_steps: The number of steps to train on.
         learning_rate: The learning rate for the generator and discriminator
         print_output_every_n_steps: The number of training steps before we print generated output
+        num_workers: Background processes preparing batches, 0 prepares them in the training loop
+        pin_memory: Whether batches are copied into pinned memory
+        prefetch_factor: The number of batches each worker prepares ahead
+        headless: Train without console output or plot windows, logging metrics to training_log
+            and writing loss plots to files instead
+        training_log: Where headless metrics and plots go, a default TrainingLog if None
+        metrics: Accumulates the g_loss and d_loss of every step, a new one sized for the run if None
     Returns:
         generator: The trained generator model
         discriminator: The trained discriminator model
@@ -131,9 +163,16 @@ def train_even_gen(max_int: int = 128,
     # print("Island Labels: ")
     # print(true_isl_labels)
     # print(true_isl_data)
-    g_loss = []
-    d_loss = []
-    iterations = []
+    # Losses stay in tensors, they're only read back at logging intervals and for plots.
+    if metrics is None:
+        metrics = MetricsAccumulator(["g_loss", "d_loss"], capacity=training_steps)
+
+    if headless and training_log is None:
+        training_log = TrainingLog()
+
+    # True data is prepared in the background while the models train.
+    true_batches = iter(make_loader(EvenDataStream(max_int, batch_size), batch_size=None,
+        num_workers=num_workers, pin_memory=pin_memory, prefetch_factor=prefetch_factor))
 
     for i in range(training_steps):
         # zero the gradients on each iteration
@@ -149,9 +188,7 @@ def train_even_gen(max_int: int = 128,
         generated_data = generator(noise)
 
         # Generate examples of even real data
-        true_labels, true_data = generate_even_data(max_int, batch_size=batch_size)
-        true_labels = torch.tensor(true_labels).unsqueeze(1).float()
-        true_data = torch.tensor(true_data).unsqueeze(1).float()
+        true_labels, true_data = next(true_batches)
 
         # Train the generator
         # We invert the labels here and don't train the discriminator because we want the generator
@@ -161,8 +198,8 @@ def train_even_gen(max_int: int = 128,
         # Here's where the Generator's performance is evaluated against our true labels,
         #       based on the evaluation of the discriminator.
         generator_loss = loss(generator_discriminator_out, true_labels)
-        g_loss.append(generator_loss.detach().numpy())
-        print("Generator Accuracy: " + str(generator_loss.detach().numpy()))
+        if not headless:
+            print("Generator Accuracy: " + str(generator_loss.item()))
         
         # The performance is backpropagated
         generator_loss.backward()
@@ -187,15 +224,25 @@ def train_even_gen(max_int: int = 128,
         generator_discriminator_loss = loss(generator_discriminator_out, torch.zeros(batch_size, 1))
 
         discriminator_loss = (true_discriminator_loss + generator_discriminator_loss) / 2
-        d_loss.append(discriminator_loss.detach().numpy())
+        metrics.record(i, g_loss=generator_loss, d_loss=discriminator_loss)
         discriminator_loss.backward()
         discriminator_optimizer.step()
 
-        iterations.append(i)
-        if i % print_output_every_n_steps == 0:
+        if headless:
+            if training_log.should_log(i):
+                training_log.log("even", i, **metrics.summary(training_log.log_every))
+        elif i % print_output_every_n_steps == 0:
             print(convert_float_matrix_to_int_list(generated_data))
 
     # Plot the loss/accuracy over the course of the training.
+    iterations, losses = metrics.series()
+    g_loss, d_loss = losses["g_loss"], losses["d_loss"]
+    if headless:
+        training_log.plot("even_loss.png", iterations, {"G Accuracy": g_loss, "D Loss": d_loss}, ylabel="Performance")
+        return generator, discriminator
+
+    # pyplot is only needed for plot windows, and is slow to import.
+    import matplotlib.pyplot as plt
     plt.plot(iterations, g_loss, label='G Accuracy')
     plt.plot(iterations, d_loss, label="D Loss")
     plt.legend()
@@ -219,61 +266,76 @@ def generate_4D_noise(batch_size, num_channels, resolution):
     # print( rand_data )
     return rand_data
 
-# Data must be [3][1024] - Channels / Data
+# Data must be [batch][channels][values] - e.g. the (batch, 3, 1024) channels from IslandDataset.
+#       The first num_channels channels of each sample are viewed as resolution x resolution images.
 def construct_4D_tensor(data, batch_size, num_channels, resolution):
-    data_lists = []
-    # print(data)
-
-    # For each channel, construct a list.
-
-    for i in range(0, batch_size):
-        # print("\nconstruct_4D_tensor : BATCH " + str(i+1))
-
-        batch = []
-
-        for j in range(0, num_channels):
-            
-            # print("\tconstruct_4D_tensor : CHANNEL " + str(j+1))
-
-            channel_data = data[i][j]
-            channel_rows = [] # Append 32 lists of size 32.
-
-            # Each channel has 1024 values.
-            current_val_index = 0
-            for y in range(0, resolution):
-                channel_cols = []
-
-                for x in range (0, resolution):
-                    channel_cols.append(channel_data[current_val_index])
-                    current_val_index+=1
-
-                channel_rows.append(channel_cols)
-            # At the end of this loop, we have channel data constructed as a 32x32.
-
-            # print(channel_rows)
-            batch.append(channel_rows)
-            
-        # At the end of this loop, we have the full batch
-        data_lists.append(batch)
+    """Views channel data as a 4D image batch, without touching the individual values.
+    Args:
+        data: Tensor, array or nested lists of shape (batch, channels, values), with at least
+            batch_size samples, num_channels channels and resolution * resolution values
+        batch_size: Number of samples to take
+        num_channels: Number of channels to take
+        resolution: Width and height of each channel image
+    Returns:
+        Tensor of shape (batch_size, num_channels, resolution, resolution). A view onto data
+        when it's already a tensor with contiguous channels.
+    """
+    if not isinstance(data, torch.Tensor):
+        data = torch.as_tensor(np.asarray(data, dtype=np.float32))
 
-    tensor = torch.tensor(data_lists)
+    if data.dim() != 3:
+        raise ValueError("Expected data of shape (batch, channels, values), got " + str(tuple(data.shape)))
 
-    # print("\nconstruct_4D_tensor : DATA")
-    # print(tensor.size())
-    # print(tensor)
+    num_values = resolution * resolution
+    if data.shape[0] < batch_size or data.shape[1] < num_channels or data.shape[2] < num_values:
+        raise ValueError(
+            "Data of shape " + str(tuple(data.shape)) + " is too small for "
+            + str(batch_size) + " samples of " + str(num_channels) + " channels of " + str(resolution) + "x" + str(resolution)
+        )
 
-    return tensor
+    # Each channel row of values splits into resolution rows of resolution columns.
+    return data[:batch_size, :num_channels, :num_values].reshape(batch_size, num_channels, resolution, resolution)
 
-# Linear, Island Train function
+def vert_model_arguments(model_type: str, max_int: int = 128, image_resolution: int = 32, num_channels: int = 1) -> Tuple[Dict, Dict]:
+    """Constructor arguments of the vert generator and discriminator of the given type.
+    Returns:
+        generator_kwargs: For VertGenerator or DCVertGenerator
+        discriminator_kwargs: For Discriminator or DCVertDiscriminator
+    """
+    if model_type == "linear":
+        input_length = int(math.log(max_int, 2))
+        return {"input_length": input_length}, {"input_length": input_length}
+    if model_type == "dc":
+        return (
+            {"input_length": image_resolution * image_resolution * num_channels, "n_channels": num_channels, "num_base_filters": None},
+            {"image_size": image_resolution, "input_channels": num_channels}
+        )
+    raise ValueError("Unknown vert model type " + str(model_type) + ", expected one of " + ", ".join(VERT_MODEL_TYPES))
+
+# Linear or DC, Island Train function
 def train_vert_gen(max_int: int = 128,
     batch_size: int = 32,
     image_resolution: int = 32,
     num_channels: int = 1,
-    training_steps: int = 10001,
+    training_steps: int = VERT_TRAINING_STEPS,
     learning_rate: float = 0.002,
     print_output_every_n_steps: int = 1000,
+    island_set_path: Optional[str] = None,
+    num_workers: int = 0,
+    pin_memory: bool = False,
+    prefetch_factor: int = 2,
+    headless: bool = False,
+    training_log: Optional[TrainingLog] = None,
+    metrics: Optional[MetricsAccumulator] = None,
+    checkpoint_dir: Optional[str] = None,
+    checkpoint_every: int = 1000,
+    resume: bool = False,
+    model_type: str = "linear",
+    precision: str = "fp32",
+    channels_last: bool = False,
+    ingest_workers: int = 1,
 ) -> Tuple[nn.Module]:
-    """Trains the even GAN
+    """Trains the vert GAN
     Args:
         max_int: The maximum integer our dataset goes to.  It is used to set the size of the binary
             lists
@@ -281,45 +343,85 @@ def train_vert_gen(max_int: int = 128,
         training_steps: The number of steps to train on.
         learning_rate: The learning rate for the generator and discriminator
         print_output_every_n_steps: The number of training steps before we print generated output
+        island_set_path: Folder of .obj island meshes, the true distribution, the configured island set if None
+        num_workers: Background processes preparing batches, 0 prepares them in the training loop
+        pin_memory: Whether batches are copied into pinned memory
+        prefetch_factor: The number of batches each worker prepares ahead
+        headless: Train without console output or plot windows, logging metrics to training_log
+            and writing loss plots to files instead
+        training_log: Where headless metrics and plots go, a default TrainingLog if None
+        metrics: Accumulates the g_loss and d_loss of every step, a new one sized for the run if None
+        checkpoint_dir: Folder checkpoints are written to, None disables checkpointing
+        checkpoint_every: The number of training steps between checkpoints
+        resume: Carry on from the newest checkpoint in checkpoint_dir, if there is one
+        model_type: linear for VertGenerator / Discriminator, dc for DCVertGenerator / DCVertDiscriminator
+        precision: fp32, or bf16 to run the forward passes under CPU bfloat16 autocast
+        channels_last: Run the DC models' convolutions in channels_last (NHWC) memory format
+        ingest_workers: Processes parsing the island files that aren't cached yet
     Returns:
         generator: The trained generator model
         discriminator: The trained discriminator model
     """
-    input_length = int(math.log(max_int, 2))
+    generator_kwargs, discriminator_kwargs = vert_model_arguments(model_type, max_int, image_resolution, num_channels)
+    dc_models = model_type == "dc"
 
     # Models
-    generator = VertGenerator(input_length)
-    discriminator = Discriminator(input_length)
-
-    # dc_generator = DCVertGenerator(image_resolution*image_resolution*num_channels, num_channels, None)
-    # dc_discriminator = DCVertDiscriminator(image_resolution, num_channels)
-
-    # DC Models
-    # generator = DCGenerator(3074, 3, None)
-    # discriminator = DCDiscriminator(3074, 3)
+    if dc_models:
+        generator = DCVertGenerator(**generator_kwargs)
+        discriminator = DCVertDiscriminator(**discriminator_kwargs)
+        if channels_last:
+            to_channels_last(generator)
+            to_channels_last(discriminator)
+    else:
+        generator = VertGenerator(**generator_kwargs)
+        discriminator = Discriminator(**discriminator_kwargs)
 
     # Optimizers
     generator_optimizer = torch.optim.Adam(generator.parameters(), lr=learning_rate)
     discriminator_optimizer = torch.optim.Adam(discriminator.parameters(), lr=learning_rate)
 
-    # dc_generator_optimizer = torch.optim.Adam(dc_generator.parameters(), lr=learning_rate)
-    # dc_discriminator_optimizer = torch.optim.Adam(dc_discriminator.parameters(), lr=learning_rate)
+    # Under distributed training every replica starts from rank 0's weights.
+    broadcast_parameters(generator)
+    broadcast_parameters(discriminator)
 
     # loss
     loss = nn.BCELoss()
     # loss = nn.MarginRankingLoss()
     # loss = nn.L1Loss()
     
-    true_isl_labels, true_isl_data = load_island_data()
+    true_isl_labels, true_isl_data = load_island_data(island_set_path, workers=ingest_workers)
+
+    if headless and training_log is None:
+        training_log = TrainingLog()
+
+    # Stack the true distribution into tensors once, batches are drawn from them in the background.
+    island_dataset = IslandDataset(true_isl_labels, true_isl_data)
+    true_batches = endless(make_island_loader(island_dataset, batch_size,
+        num_workers=num_workers, pin_memory=pin_memory, prefetch_factor=prefetch_factor))
 
     # print("Island Labels: ")
     # print(true_isl_labels)
     # print(true_isl_data)
-    g_loss_over_time = []
-    d_loss_over_time = []
-    time = []
-
-    for i in range(training_steps):
+    # Losses stay in tensors, they're only read back at logging intervals and for plots.
+    if metrics is None:
+        metrics = MetricsAccumulator(["g_loss", "d_loss"], capacity=training_steps)
+
+    # Carry on from the newest checkpoint of an interrupted run: weights, optimizers, RNGs and losses.
+    # Each model type checkpoints under its own name, their weights aren't interchangeable.
+    run_name = "vert_dc" if dc_models else "vert"
+    start_step = 0
+    if resume and checkpoint_dir is not None:
+        checkpoint_file = latest_checkpoint(checkpoint_dir, run_name)
+        if checkpoint_file is not None:
+            checkpoint = load_checkpoint(checkpoint_file, generator, discriminator, generator_optimizer, discriminator_optimizer)
+            metrics.load_state_dict(checkpoint["extra"]["metrics"])
+            start_step = checkpoint["step"] + 1
+            print("Resuming vert training from step", start_step, "of", checkpoint_file)
+
+            # The checkpoint holds rank 0's RNG state, replicas go back to drawing their own batches and noise.
+            reseed_replica(start_step)
+
+    for i in range(start_step, training_steps):
         # zero the gradients on each iteration
         generator_optimizer.zero_grad()
 
@@ -327,27 +429,33 @@ def train_vert_gen(max_int: int = 128,
         # Need float type instead of int
         
         # Generate noise, this is where we can adjust the dimensions
-        noise = generate_noise(batch_size)
-        dc_noise = generate_4D_noise(batch_size, num_channels, image_resolution)
+        if dc_models:
+            noise = generate_4D_noise(batch_size, num_channels, image_resolution)
+            if channels_last:
+                noise = noise.contiguous(memory_format=torch.channels_last)
+        else:
+            noise = generate_noise(batch_size)
 
         # print("\nGenerated noise:")
         # print(noise.size())
         # print(noise)
 
-        generated_data = generator(noise)
-        # dc_generated_data = dc_generator(dc_noise)
+        with precision_autocast(precision):
+            generated_data = generator(noise)
 
-        print("\nGenerated Data")
-        print(generated_data.size())
-        print(generated_data)
+        if not headless:
+            print("\nGenerated Data")
+            print(generated_data.size())
+            print(generated_data)
 
         # Generate examples of even real data
-        true_labels, true_data, true_channels = sample_island_data(true_isl_labels, true_isl_data, batch_size)
-        true_labels = torch.tensor(true_labels).unsqueeze(1).float()
-        true_data = torch.tensor(true_data).unsqueeze(1).float()
+        true_labels, true_data, true_channels = next(true_batches)
 
-        true_4D_data = construct_4D_tensor(true_channels, batch_size, num_channels, image_resolution) # 32x32, 1 channel, 4D Tensor
-        # true_channels = torch.tensor(true_channels).unsqueeze(1).float()
+        # The DC discriminator sees the true islands as images, 32x32, num_channels, 4D Tensor
+        if dc_models:
+            true_data = construct_4D_tensor(true_channels, batch_size, num_channels, image_resolution)
+            if channels_last:
+                true_data = true_data.contiguous(memory_format=torch.channels_last)
 
         # print("\nTrue data (1D) (1, 1024):")
         # print( true_data.size() )
@@ -361,85 +469,178 @@ def train_vert_gen(max_int: int = 128,
         # We invert the labels here and don't train the discriminator because we want the generator
         #   to make things the discriminator classifies as true.
         #   For this to work the discriminator has to be decent.
-        generator_discriminator_out = discriminator(generated_data)
-        # dc_generator_discriminator_out = dc_discriminator(dc_generated_data)
+        with precision_autocast(precision):
+            generator_discriminator_out = discriminator(generated_data)
+            generator_loss = loss(generator_discriminator_out, true_labels)
 
-
-        # print("\nDiscriminator's output on random data: ")
-        # print (dc_generator_discriminator_out.size())
-        # print (dc_generator_discriminator_out)
-
-        generator_loss = loss(generator_discriminator_out, true_labels)
-        g_loss_over_time.append(generator_loss.detach().numpy())
-        # dc_generator_loss = loss(dc_generator_discriminator_out, true_labels)
-
-        print("Random Generator Loss: ")
-        print (generator_loss.detach().numpy())
+        if not headless:
+            print("Random Generator Loss: ")
+            print (generator_loss.item())
         generator_loss.backward()
+        average_gradients(generator)
         generator_optimizer.step()
 
-        # dc_generator_loss.backward()
-        
         # Train the discriminator on the true/generated data
         discriminator_optimizer.zero_grad()
-        true_discriminator_out = discriminator(true_data)
-        # print("\nDiscriminator's output on true data: ")
-        # print (true_discriminator_out)
-
-        true_discriminator_out = torch.reshape(true_discriminator_out, (batch_size, 1))
-        # print (true_discriminator_out)
-        true_discriminator_loss = loss(true_discriminator_out, true_labels)
-        # print("True Discriminator Loss: ")
-        # print(true_discriminator_loss)
-
-        # add .detach() here think about this
-        generator_discriminator_out = discriminator(generated_data.detach())
-        # print(generator_discriminator_out.size())
-        # print(torch.zeros(batch_size, 1).size())
-        generator_discriminator_loss = loss(generator_discriminator_out, torch.zeros(batch_size, 1))
+        with precision_autocast(precision):
+            true_discriminator_out = discriminator(true_data)
+            # print("\nDiscriminator's output on true data: ")
+            # print (true_discriminator_out)
+
+            true_discriminator_out = torch.reshape(true_discriminator_out, (batch_size, 1))
+            # print (true_discriminator_out)
+            true_discriminator_loss = loss(true_discriminator_out, true_labels)
+            # print("True Discriminator Loss: ")
+            # print(true_discriminator_loss)
+
+            # add .detach() here think about this
+            generator_discriminator_out = discriminator(generated_data.detach())
+            # print(generator_discriminator_out.size())
+            # print(torch.zeros(batch_size, 1).size())
+            generator_discriminator_loss = loss(generator_discriminator_out, torch.zeros(batch_size, 1))
 
         discriminator_loss = (
             true_discriminator_loss + generator_discriminator_loss
         ) / 2
-        d_loss_over_time.append(discriminator_loss.detach().numpy())
+        metrics.record(i+1, g_loss=generator_loss, d_loss=discriminator_loss)
         discriminator_loss.backward()
+        average_gradients(discriminator)
         discriminator_optimizer.step()
 
-        time.append(i+1)
+
+        if headless and training_log.should_log(i):
+            training_log.log("vert", i, **metrics.summary(training_log.log_every))
+
+        # Replicas are identical, only rank 0 writes checkpoints.
+        if checkpoint_dir is not None and is_main_process() and ((i + 1) % checkpoint_every == 0 or i == training_steps - 1):
+            save_checkpoint(checkpoint_dir, run_name, i, generator, discriminator,
+                generator_optimizer, discriminator_optimizer, extra={"metrics": metrics.state_dict()})
 
         # This is just to see progress as more training occurs
         if i % print_output_every_n_steps == 0:
-            plt.plot(time, g_loss_over_time, label='G')
-            plt.plot(time, d_loss_over_time, label="D")
-            plt.legend()
-            plt.ylabel('Loss')
-            plt.xlabel('Iterations')
-            plt.show()
+            time, losses = metrics.series()
+            g_loss_over_time, d_loss_over_time = losses["g_loss"], losses["d_loss"]
+            if headless:
+                training_log.plot("vert_loss_" + str(i) + ".png", time, {"G": g_loss_over_time, "D": d_loss_over_time})
+            else:
+                import matplotlib.pyplot as plt
+                plt.plot(time, g_loss_over_time, label='G')
+                plt.plot(time, d_loss_over_time, label="D")
+                plt.legend()
+                plt.ylabel('Loss')
+                plt.xlabel('Iterations')
+                plt.show()
 
     # END LOOP
 
 
     return generator, discriminator
 
+def train_models(
+    headless: bool = False,
+    island_set_path: Optional[str] = None,
+    log_file: Optional[str] = "training_log.jsonl",
+    log_every: int = 100,
+    plot_dir: Optional[str] = "plots",
+    num_workers: int = 0,
+    metrics_dir: Optional[str] = None,
+    metrics_format: str = "npz",
+    checkpoint_dir: Optional[str] = "checkpoints",
+    checkpoint_every: int = 1000,
+    resume: bool = False,
+    intra_op_threads: Optional[int] = None,
+    inter_op_threads: Optional[int] = None,
+    model_type: str = "linear",
+    precision: str = "fp32",
+    channels_last: bool = False,
+    ingest_workers: int = 1,
+    world_size: int = 1
+) -> Tuple[nn.Module]:
+    """Trains the even and vert GANs and exports the vert models to the configured model folder.
+        With a metrics_dir, the per-step losses of each GAN are exported there as
+        even_metrics.<format> and vert_metrics.<format>, csv or npz.
+        Vert training is checkpointed to checkpoint_dir, and with resume carries on from there.
+        intra_op_threads and inter_op_threads size torch's thread pools, None keeps its defaults.
+        model_type picks the linear or DC vert models, trained at the given precision and,
+        for the DC models, optionally in channels_last memory format.
+        ingest_workers processes parse the island set, where it isn't cached.
+        With a world_size over 1, the vert GAN trains data parallel across that many processes,
+        headless, and rank 0 exports the vert models, see Distributed.launch().
+    Returns:
+        vert_generator: The trained generator model
+        vert_discriminator: The trained discriminator model
+    """
+    configure_threads(intra_op_threads, inter_op_threads)
+
+    training_log = TrainingLog(log_file, log_every, plot_dir) if headless else None
+    even_metrics = MetricsAccumulator(["g_loss", "d_loss"], capacity=EVEN_TRAINING_STEPS)
+
+    even_generator, even_discriminator = train_even_gen(
+        num_workers=num_workers, headless=headless, training_log=training_log, metrics=even_metrics)
+    vert_kwargs = dict(island_set_path=island_set_path, num_workers=num_workers,
+        checkpoint_dir=checkpoint_dir, checkpoint_every=checkpoint_every, resume=resume,
+        model_type=model_type, precision=precision, channels_last=channels_last, ingest_workers=ingest_workers)
+
+    if metrics_dir is not None:
+        os.makedirs(metrics_dir, exist_ok=True)
+        even_metrics.save(os.path.join(metrics_dir, "even_metrics." + metrics_format))
+    vert_metrics_path = os.path.join(metrics_dir, "vert_metrics." + metrics_format) if metrics_dir is not None else None
+
+    paths = get_paths()
+    if world_size > 1:
+        # Rank 0 logs, then exports the models and its losses, which are read back from its exports.
+        #       The even GAN's log is closed first, rank 0 appends to the same file.
+        if training_log is not None:
+            training_log.close()
+            training_log = None
+        launch(world_size, vert_kwargs, intra_op_threads, inter_op_threads,
+            export_path=paths.model_path("vert_gen.model"), discriminator_export_path=paths.model_path("vert_disc.model"),
+            metrics_path=vert_metrics_path, log_file=log_file, log_every=log_every, plot_dir=plot_dir)
+        vert_generator = load_model(paths.model_path("vert_gen.model"))
+        vert_discriminator = load_model(paths.model_path("vert_disc.model"))
+    else:
+        vert_metrics = MetricsAccumulator(["g_loss", "d_loss"], capacity=VERT_TRAINING_STEPS)
+        vert_generator, vert_discriminator = train_vert_gen(
+            headless=headless, training_log=training_log, metrics=vert_metrics, **vert_kwargs)
+
+        if vert_metrics_path is not None:
+            vert_metrics.save(vert_metrics_path)
+
+        # Weights only exports, the server loads them without unpickling any classes.
+        #       The constructor arguments are train_vert_gen's, from its default sizes.
+        generator_kwargs, discriminator_kwargs = vert_model_arguments(model_type)
+        export_model(vert_generator, paths.model_path("vert_gen.model"), **generator_kwargs)
+        export_model(vert_discriminator, paths.model_path("vert_disc.model"), **discriminator_kwargs)
+
+    if training_log is not None:
+        training_log.close()
+
+    # And the generator as a frozen TorchScript graph, served with --model-file vert_gen.ts.
+    export_torchscript(vert_generator, paths.model_path("vert_gen.ts"))
+
+    return vert_generator, vert_discriminator
+
 # __name__ is a special variable that is used to ensure we only execute in the main file
 if __name__ == "__main__":
-    # loaded_labels, loaded_data = load_island_data()
-    even_generator, even_discriminator = train_even_gen()
-    vert_generator, vert_discriminator = train_vert_gen()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Trains the Anvil GANs")
+    add_path_arguments(parser)
+    add_training_arguments(parser)
+    args = parser.parse_args()
+    configure_paths_from_args(args)
 
     # input_length = int(math.log(128, 2))
     # noise = torch.randint(0, 2, size=(16, input_length)).float()
     # generated_data = vert_generator(noise)
 
+    vert_generator, vert_discriminator = train_models(
+        args.headless, get_paths().island_set, args.log_file, args.log_every, args.plot_dir, args.num_workers,
+        args.metrics_dir, args.metrics_format, args.checkpoint_dir, args.checkpoint_every, args.resume,
+        args.intra_op_threads, args.inter_op_threads, args.model, args.precision, args.channels_last, args.ingest_workers,
+        args.world_size)
 
     print(vert_generator)
     print(vert_discriminator)
 
-    torch.save(vert_generator, "vert_gen.model")
-    torch.save(vert_discriminator, "vert_disc.model")
-
-
     # print(convert_float_matrix_to_int_list(generated_data))
-
-
-
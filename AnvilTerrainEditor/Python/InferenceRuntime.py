@@ -0,0 +1,104 @@
+import json
+import warnings
+
+from os.path import exists, splitext
+
+from typing import Dict, Optional, Tuple
+
+import torch
+
+
+# Runs generators exported by Checkpoint.export_torchscript() / export_onnx() for inference.
+#       The artifacts hold a frozen, fused graph with the weights baked in, so loading one needs
+#       neither the Models module nor any model construction, only torch or onnxruntime.
+#       Each artifact carries a small metadata record, e.g. the shape of the noise it takes.
+
+SCRIPT_EXTENSION = ".ts"
+ONNX_EXTENSION = ".onnx"
+METADATA_FILE = "anvil.json"
+RUNTIME_FORMAT = "anvil-runtime"
+RUNTIME_VERSION = 1
+
+# Noise of the linear VertGenerator, for models that don't say otherwise.
+DEFAULT_NOISE_SHAPE = (1024,)
+
+
+def is_runtime_artifact(path: str) -> bool:
+    return splitext(path)[1] in (SCRIPT_EXTENSION, ONNX_EXTENSION)
+
+def noise_shape(model) -> Tuple[int, ...]:
+    """Shape of one sample of the noise a generator takes, from an eager model or a runtime artifact."""
+    return tuple(getattr(model, "noise_shape", DEFAULT_NOISE_SHAPE))
+
+def make_noise(rows: int, shape: Tuple[int, ...], generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    # The distribution of Generator.generate_noise() and generate_4D_noise(), for any shape.
+    return torch.rand((rows,) + tuple(shape), generator=generator) - 0.5
+
+def runtime_metadata(model_class: str, shape: Tuple[int, ...]) -> Dict:
+    return {"format": RUNTIME_FORMAT, "version": RUNTIME_VERSION, "class": model_class, "noise_shape": list(shape)}
+
+def check_metadata(metadata: Dict, path: str) -> Dict:
+    if metadata.get("format") != RUNTIME_FORMAT or metadata.get("version") != RUNTIME_VERSION:
+        raise ValueError(path + " isn't a version " + str(RUNTIME_VERSION) + " Anvil runtime artifact")
+    return metadata
+
+
+# A frozen TorchScript generator.
+class ScriptedGenerator:
+
+    def __init__(self, path: str):
+        extra_files = {METADATA_FILE: ""}
+
+        # TorchScript is deprecated in newer torch releases, and says so on every call.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            warnings.simplefilter("ignore", FutureWarning)
+            module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+            # Rewrites the frozen graph for this machine, e.g. oneDNN convolutions with prepacked weights.
+            self.module = torch.jit.optimize_for_inference(module)
+
+        self.metadata = check_metadata(json.loads(extra_files[METADATA_FILE] or "{}"), path)
+        self.noise_shape = tuple(self.metadata["noise_shape"])
+
+    def eval(self):
+        # Frozen graphs are always in inference mode, this matches nn.Module for the registry.
+        return self
+
+    def __call__(self, noise: torch.Tensor) -> torch.Tensor:
+        return self.module(noise)
+
+
+# An ONNX generator run by onnxruntime, which is only needed once one is loaded.
+#       Its metadata sits next to it, in <path>.json.
+class OnnxGenerator:
+
+    def __init__(self, path: str):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("ONNX models need onnxruntime, install it with: pip install onnxruntime")
+
+        with open(path + ".json") as file:
+            self.metadata = check_metadata(json.load(file), path)
+        self.noise_shape = tuple(self.metadata["noise_shape"])
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def eval(self):
+        return self
+
+    def __call__(self, noise: torch.Tensor) -> torch.Tensor:
+        outputs = self.session.run(None, {self.input_name: noise.numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+def load_runtime(path: str):
+    """Loads a TorchScript (.ts) or ONNX (.onnx) generator, by the extension of path."""
+    if not exists(path):
+        raise FileNotFoundError(path)
+    if splitext(path)[1] == ONNX_EXTENSION:
+        return OnnxGenerator(path)
+    return ScriptedGenerator(path)
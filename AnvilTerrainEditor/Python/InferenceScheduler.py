@@ -0,0 +1,246 @@
+import threading
+import time
+
+from collections import deque
+
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional
+
+from AnvilConfig import get_paths
+from ModelRegistry import ModelRegistry, get_registry
+
+# torch is imported by the worker thread, on the first batch, so a server that never generates
+#       from the model never pays for it.
+if TYPE_CHECKING:
+    import torch
+
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT = 0.005 # Seconds a batch stays open for more jobs after its first one
+DEFAULT_MAX_QUEUE_DEPTH = 256
+
+
+# A request's share of a batch: some number of noise rows, and the generated rows once done.
+class InferenceJob:
+
+    def __init__(self, count: int, seed: Optional[int] = None):
+        self.count = count
+        self.seed = seed
+        self.result: Optional["torch.Tensor"] = None
+        self.error: Optional[BaseException] = None
+
+        self.queued_time = time.time()
+        self.done = threading.Event()
+
+
+# Sits between the /Generate/ handlers and the generator model.
+#       Requests from concurrent users are queued as jobs, and a single worker thread coalesces
+#       them into batches bounded by max_batch_size rows and max_wait seconds, runs one forward
+#       pass per batch, and hands each request back its own rows.
+class InferenceScheduler:
+
+    def __init__(self,
+        model_path: Optional[str] = None,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait: float = DEFAULT_MAX_WAIT,
+        max_queue_depth: int = DEFAULT_MAX_QUEUE_DEPTH,
+        registry: Optional[ModelRegistry] = None,
+        precision: str = "fp32",
+        channels_last: bool = False
+    ):
+        """
+        Args:
+            model_path: Generator model, fetched from the registry for every batch, the configured one if None.
+            max_batch_size: Maximum number of noise rows in one forward pass. A single job larger
+                than this still runs, alone.
+            max_wait: Maximum number of seconds the first job of a batch waits for others to join.
+            max_queue_depth: Maximum number of queued jobs, submitting blocks while the queue is full.
+            registry: Model registry to load from, the process-wide one by default.
+            precision: fp32, or bf16 to run the forward passes under CPU bfloat16 autocast.
+            channels_last: Convert DC generators to channels_last memory format as they're loaded.
+        """
+        self.model_path = model_path if model_path is not None else get_paths().model_file
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue_depth = max_queue_depth
+        self.registry = registry
+        self.precision = precision
+        self.channels_last = channels_last
+
+        # The last model converted to channels_last, a hot reload brings in a new one.
+        self._channels_last_model: Optional["torch.nn.Module"] = None
+
+        self._queue: Deque[InferenceJob] = deque()
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+        # Statistics
+        self.jobs = 0
+        self.rows = 0
+        self.batches = 0
+        self.max_batch_rows = 0
+        self.peak_queue_depth = 0
+        self.total_wait_time = 0.0
+        self.total_inference_time = 0.0
+
+    def _start(self):
+        # The worker is started by the first submitted job, so importing this module costs nothing.
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="InferenceScheduler", daemon=True)
+            self._worker.start()
+
+    def submit(self, count: int, seed: Optional[int] = None) -> InferenceJob:
+        """Queues a job for count generated rows, blocking while the queue is full.
+            A seeded job gets the same noise whatever it's batched with.
+        """
+        job = InferenceJob(count, seed)
+
+        with self._condition:
+            self._start()
+            while len(self._queue) >= self.max_queue_depth:
+                self._condition.wait()
+
+            job.queued_time = time.time()
+            self._queue.append(job)
+            self.peak_queue_depth = max(self.peak_queue_depth, len(self._queue))
+            self._condition.notify_all()
+
+        return job
+
+    def generate(self, count: int, seed: Optional[int] = None) -> "torch.Tensor":
+        """Generates count rows of vert data, batched together with any concurrent requests.
+        Args:
+            seed: Seeds the job's noise, so the same seed generates the same rows, random if None
+        Returns:
+            Tensor of shape (count, values)
+        """
+        job = self.submit(count, seed)
+        job.done.wait()
+
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _next_batch(self) -> List[InferenceJob]:
+        # Wait for a first job, then keep the batch open until it's full or max_wait runs out.
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+
+            batch = [self._queue.popleft()]
+            rows = batch[0].count
+            deadline = time.time() + self.max_wait
+
+            while rows < self.max_batch_size:
+                if self._queue:
+                    if rows + self._queue[0].count > self.max_batch_size:
+                        break
+                    job = self._queue.popleft()
+                    batch.append(job)
+                    rows += job.count
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            # Room was made in the queue for blocked submitters.
+            self._condition.notify_all()
+
+        return batch
+
+    def _run_batch(self, batch: List[InferenceJob]):
+        start_time = time.time()
+        rows = sum(job.count for job in batch)
+
+        try:
+            import torch
+            from InferenceRuntime import make_noise, noise_shape
+            from Models import DCVertGenerator, precision_autocast, to_channels_last
+
+            registry = self.registry if self.registry is not None else get_registry()
+            vert_generator = registry.get(self.model_path)
+
+            # DC generators take 4D noise and return (rows, channels, resolution, resolution) images.
+            channels_last = self.channels_last and isinstance(vert_generator, DCVertGenerator)
+            if channels_last and vert_generator is not self._channels_last_model:
+                self._channels_last_model = to_channels_last(vert_generator)
+            shape = noise_shape(vert_generator)
+            if all(job.seed is None for job in batch):
+                noise = make_noise(rows, shape)
+            else:
+                noise = torch.cat([make_noise(job.count, shape,
+                    None if job.seed is None else torch.Generator().manual_seed(job.seed)) for job in batch])
+
+            # In the weights' layout, so the first convolution doesn't convert it.
+            if channels_last and noise.dim() == 4:
+                noise = noise.contiguous(memory_format=torch.channels_last)
+
+            with torch.inference_mode(), precision_autocast(self.precision):
+                genned_verts = vert_generator(noise)
+            genned_verts = genned_verts.float()
+
+            # Hand each job its own slice of the batch.
+            offset = 0
+            for job in batch:
+                job.result = genned_verts[offset:offset + job.count]
+                offset += job.count
+
+        except Exception as ex:
+            for job in batch:
+                job.error = ex
+
+        end_time = time.time()
+        with self._condition:
+            self.jobs += len(batch)
+            self.rows += rows
+            self.batches += 1
+            self.max_batch_rows = max(self.max_batch_rows, rows)
+            self.total_wait_time += sum(start_time - job.queued_time for job in batch)
+            self.total_inference_time += end_time - start_time
+
+        for job in batch:
+            job.done.set()
+
+    def _run(self):
+        while True:
+            self._run_batch(self._next_batch())
+
+    def stats(self) -> Dict[str, float]:
+        """Queue and batch statistics since startup, times in milliseconds."""
+        with self._condition:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "max_queue_depth": self.max_queue_depth,
+                "precision": self.precision,
+                "channels_last": self.channels_last,
+                "queue_depth": len(self._queue),
+                "peak_queue_depth": self.peak_queue_depth,
+                "jobs": self.jobs,
+                "rows": self.rows,
+                "batches": self.batches,
+                "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+                "max_batch_rows": self.max_batch_rows,
+                "mean_jobs_per_batch": self.jobs / self.batches if self.batches else 0.0,
+                "mean_wait_ms": self.total_wait_time / self.jobs * 1000 if self.jobs else 0.0,
+                "mean_inference_ms": self.total_inference_time / self.batches * 1000 if self.batches else 0.0
+            }
+
+
+# The single scheduler shared by every request in this process.
+_scheduler: Optional[InferenceScheduler] = None
+
+def get_scheduler() -> InferenceScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = InferenceScheduler()
+    return _scheduler
+
+def configure_scheduler(**kwargs) -> InferenceScheduler:
+    """Replaces the shared scheduler with one built from the given InferenceScheduler arguments.
+        Meant to be called once at startup, before any request is served.
+    """
+    global _scheduler
+    _scheduler = InferenceScheduler(**kwargs)
+    return _scheduler
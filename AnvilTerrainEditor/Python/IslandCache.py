@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from os.path import join
+
+from typing import IO, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from AnvilConfig import get_paths
+from FileScanner import FileScanner
+from Utils import WAVEFRONT_EXTENSIONS, MeshData, Vector3, parse_obj_files, report_parse_failures
+
+
+# Preprocessed, on-disk copy of an island folder, so runs and servers don't re-parse every OBJ.
+#       The cache is a folder of .npy arrays, memory-mapped on load, and a manifest:
+#           channels.npy        float32 (islands, 3, max_verts), x / y / z zero padded or cut
+#           verts.npy           float32 (total verts, 3), every island's verts back to back
+#           vert_offsets.npy    int64 (islands + 1), island i's verts are verts[offsets[i]:offsets[i+1]]
+#           indices.npy         uint32 (total indices,), flat triangle indices
+#           index_offsets.npy   int64 (islands + 1)
+#           manifest.json       the source file of every island, with its size, mtime and sha1,
+#                               and the files that couldn't be parsed, with why
+#       A file whose size and mtime match the manifest is taken from the cache as it is. Otherwise
+#       it's hashed, and only re-parsed when its contents really changed.
+
+CACHE_FORMAT = "anvil-island-cache"
+CACHE_VERSION = 1
+CACHE_DIR_NAME = ".island_cache"
+MANIFEST_FILE = "manifest.json"
+CACHE_ARRAYS = ["channels", "verts", "vert_offsets", "indices", "index_offsets"]
+
+
+def default_cache_dir(directory: str) -> str:
+    # Under the configured island cache folder if there is one, otherwise in the island folder.
+    return get_paths().island_cache_dir(directory) or join(directory, CACHE_DIR_NAME)
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def scan_islands(directory: str) -> Dict[str, os.stat_result]:
+    """Every wavefront file under directory, by relative path, with its stat."""
+    return FileScanner(directory, WAVEFRONT_EXTENSIONS).scan()
+
+def stack_channels(verts: np.ndarray, offsets: np.ndarray, max_verts: int) -> np.ndarray:
+    # Scatter every island's first max_verts verts into its zero padded (3, max_verts) row.
+    counts = np.minimum(np.diff(offsets), max_verts)
+    island = np.repeat(np.arange(len(counts)), counts)
+    rank = np.arange(len(island)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    channels = np.zeros((len(counts), max_verts, 3), dtype=np.float32)
+    channels[island, rank] = verts[offsets[island] + rank]
+    return np.ascontiguousarray(channels.transpose(0, 2, 1))
+
+
+# The islands of a folder, as read back from the cache.
+#       meshes() wraps slices of the memory-mapped arrays, nothing is copied until it's used.
+class IslandCache:
+
+    def __init__(self, directory: str, cache_dir: str, manifest: Dict, arrays: Dict[str, np.ndarray]):
+        self.directory = directory
+        self.cache_dir = cache_dir
+        self.manifest = manifest
+        self.names: List[str] = [entry["name"] for entry in manifest["files"]]
+        self.failures: Dict[str, str] = {entry["name"]: entry["error"] for entry in manifest.get("failed", [])}
+        self.max_verts: int = manifest["max_verts"]
+
+        self.channels = arrays["channels"]
+        self.verts = arrays["verts"]
+        self.vert_offsets = arrays["vert_offsets"]
+        self.indices = arrays["indices"]
+        self.index_offsets = arrays["index_offsets"]
+
+        # Files re-parsed to bring the cache up to date, by the load that built this.
+        self.rebuilt: List[str] = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def mesh(self, i: int) -> MeshData:
+        verts = self.verts[self.vert_offsets[i]:self.vert_offsets[i + 1]]
+        indices = self.indices[self.index_offsets[i]:self.index_offsets[i + 1]]
+        return MeshData(Vector3(0, 0, 0), verts, indices)
+
+    def meshes(self) -> "IslandList":
+        return IslandList([self.mesh(i) for i in range(len(self))], self.channels)
+
+    def content_hash(self) -> str:
+        """Hash of every cached file's name and sha1, the same in every process reading the same islands."""
+        digest = hashlib.sha1(str(self.max_verts).encode("utf-8"))
+        for entry in self.manifest["files"]:
+            digest.update((entry["name"] + "\0" + entry["sha1"] + "\0").encode("utf-8"))
+        return digest.hexdigest()
+
+
+# A list of cached islands that also carries their stacked channels, for IslandData.
+class IslandList(list):
+
+    def __init__(self, meshes: List[MeshData], channels: np.ndarray):
+        super(IslandList, self).__init__(meshes)
+        self.channels = channels
+
+
+def read_cache(cache_dir: str) -> Tuple[Optional[Dict], Dict[str, np.ndarray]]:
+    """The manifest and memory-mapped arrays of a cache, or no manifest if it's missing or broken."""
+    try:
+        with open(join(cache_dir, MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+        if manifest.get("format") != CACHE_FORMAT or manifest.get("version") != CACHE_VERSION:
+            return None, {}
+
+        arrays = {name: np.load(join(cache_dir, name + ".npy"), mmap_mode='r') for name in CACHE_ARRAYS}
+    except (OSError, ValueError):
+        return None, {}
+
+    # A crash between writing the arrays and the manifest leaves them out of step.
+    count = len(manifest["files"])
+    if (arrays["channels"].shape != (count, 3, manifest["max_verts"])
+        or len(arrays["vert_offsets"]) != count + 1 or arrays["vert_offsets"][-1] != len(arrays["verts"])
+        or len(arrays["index_offsets"]) != count + 1 or arrays["index_offsets"][-1] != len(arrays["indices"])):
+        return None, {}
+
+    return manifest, arrays
+
+def _replace_file(cache_dir: str, name: str, write: Callable[[IO[bytes]], None]):
+    # Written to a temp file of its own and swapped in whole. Prefork workers warm up at the
+    #       same time, each with its own temp files, so they can't write into each other's.
+    handle, temp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=cache_dir)
+    try:
+        with os.fdopen(handle, "wb") as file:
+            write(file)
+        os.replace(temp_path, join(cache_dir, name))
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def write_cache(cache_dir: str, manifest: Dict, arrays: Dict[str, np.ndarray]):
+    # Arrays first, and the manifest last, so it never describes partial data.
+    #       Concurrent writers build the same cache from the same files, whichever swaps in last wins.
+    os.makedirs(cache_dir, exist_ok=True)
+    for name in CACHE_ARRAYS:
+        _replace_file(cache_dir, name + ".npy", lambda file: np.save(file, arrays[name]))
+
+    data = json.dumps(manifest, indent=1).encode("utf-8")
+    _replace_file(cache_dir, MANIFEST_FILE, lambda file: file.write(data))
+
+def load_island_cache(
+    directory: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    max_verts: int = MeshData.MAX_VERTS,
+    workers: int = 1,
+    stats: Optional[Dict[str, os.stat_result]] = None
+) -> IslandCache:
+    """Brings the cache of an island folder up to date and memory-maps it.
+        Files that can't be parsed are reported and left out, and remembered in the manifest,
+        so they're only tried again once they change.
+    Args:
+        directory: Folder of .obj island meshes, the configured island set if None
+        cache_dir: Where the cache is kept, by default under the configured island cache folder,
+            or <directory>/.island_cache
+        max_verts: Length of each stacked channel
+        workers: Processes parsing the changed files
+        stats: The caller's scan of directory, if it has one, scanned here if None
+    Returns:
+        The cached islands, in file name order.
+    """
+    directory = directory if directory is not None else get_paths().island_set
+    cache_dir = cache_dir if cache_dir is not None else default_cache_dir(directory)
+    stats = stats if stats is not None else scan_islands(directory)
+
+    manifest, arrays = read_cache(cache_dir)
+    if manifest is not None and manifest["max_verts"] != max_verts:
+        manifest, arrays = None, {}
+    cached = {entry["name"]: (row, entry) for row, entry in enumerate(manifest["files"])} if manifest is not None else {}
+    known_failures = {entry["name"]: entry for entry in manifest.get("failed", [])} if manifest is not None else {}
+
+    # Sort every file into reused, known bad or to be parsed, then parse those all at once.
+    entries = []
+    sources: List[Optional[int]] = []
+    failed = []
+    to_parse = []
+    touched = False
+
+    for name, stat in stats.items():
+        path = join(directory, name)
+        entry = {"name": name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        row, old_entry = cached[name] if name in cached else (None, known_failures.get(name))
+        if old_entry is None:
+            to_parse.append((entry, path))
+            continue
+
+        # Unchanged, or only touched: reuse the cached arrays, or the cached failure.
+        unchanged = old_entry["size"] == stat.st_size and old_entry["mtime_ns"] == stat.st_mtime_ns
+        if not unchanged:
+            entry["sha1"] = file_hash(path)
+            touched = True
+        if not (unchanged or entry["sha1"] == old_entry["sha1"]):
+            to_parse.append((entry, path))
+            continue
+
+        entry["sha1"] = old_entry["sha1"]
+        if row is None:
+            entry["error"] = old_entry["error"]
+            failed.append(entry)
+        else:
+            entries.append(entry)
+            sources.append(row)
+
+    parsed = parse_obj_files([path for _, path in to_parse], workers)
+    rebuilt = {}
+    for (entry, path), (mesh_arrays, error) in zip(to_parse, parsed):
+        entry["sha1"] = entry.get("sha1") or file_hash(path)
+        if error is not None:
+            entry["error"] = error
+            failed.append(entry)
+        else:
+            rebuilt[entry["name"]] = mesh_arrays
+            entries.append(entry)
+            sources.append(None)
+
+    # Back into file name order, which new files and the reused ones were split out of.
+    order = sorted(range(len(entries)), key=lambda i: entries[i]["name"])
+    entries = [entries[i] for i in order]
+    sources = [sources[i] for i in order]
+    failed.sort(key=lambda entry: entry["name"])
+    report_parse_failures([(join(directory, entry["name"]), entry["error"]) for entry in failed])
+
+    removed = [name for name in list(cached) + list(known_failures) if name not in stats]
+    manifest = {"format": CACHE_FORMAT, "version": CACHE_VERSION, "max_verts": max_verts, "files": entries, "failed": failed}
+
+    # Everything cached and in place, use the memory maps as they are.
+    if not to_parse and not removed and not touched and arrays:
+        return IslandCache(directory, cache_dir, manifest, arrays)
+
+    verts: List[np.ndarray] = []
+    indices: List[np.ndarray] = []
+    for entry, row in zip(entries, sources):
+        if row is None:
+            mesh_verts, mesh_indices = rebuilt[entry["name"]]
+            verts.append(mesh_verts.astype(np.float32))
+            indices.append(mesh_indices.reshape(-1))
+        else:
+            verts.append(arrays["verts"][arrays["vert_offsets"][row]:arrays["vert_offsets"][row + 1]])
+            indices.append(arrays["indices"][arrays["index_offsets"][row]:arrays["index_offsets"][row + 1]])
+
+    vert_offsets = np.concatenate([[0], np.cumsum([len(v) for v in verts])]).astype(np.int64)
+    index_offsets = np.concatenate([[0], np.cumsum([len(i) for i in indices])]).astype(np.int64)
+    all_verts = np.concatenate(verts) if verts else np.zeros((0, 3), dtype=np.float32)
+    new_arrays = {
+        "channels": stack_channels(all_verts, vert_offsets, max_verts),
+        "verts": all_verts,
+        "vert_offsets": vert_offsets,
+        "indices": np.concatenate(indices).astype(np.uint32) if indices else np.zeros(0, dtype=np.uint32),
+        "index_offsets": index_offsets
+    }
+
+    # Drop the old maps before their files are replaced, Windows won't replace a mapped file.
+    del verts, indices, arrays
+    arrays = new_arrays
+    try:
+        write_cache(cache_dir, manifest, new_arrays)
+
+        # Mapped back in, so the arrays are shared with the page cache instead of held twice.
+        #       If a concurrent writer got in between, keep the arrays just built.
+        written_manifest, written_arrays = read_cache(cache_dir)
+        if written_manifest is not None and written_manifest["files"] == manifest["files"]:
+            manifest, arrays = written_manifest, written_arrays
+    except OSError as ex:
+        # A read only island folder still loads, just without the cache.
+        print("Island cache", cache_dir, "not written:", ex)
+
+    if rebuilt or removed:
+        print("Island cache", cache_dir, "rebuilt", len(rebuilt), "of", len(entries), "islands,", len(removed), "removed")
+
+    cache = IslandCache(directory, cache_dir, manifest, arrays)
+    cache.rebuilt = sorted(rebuilt)
+    return cache
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from AnvilConfig import add_path_arguments, configure_paths_from_args
+
+    parser = argparse.ArgumentParser(description="Compiles an island folder into its preprocessed cache")
+    add_path_arguments(parser)
+    parser.add_argument("--ingest-workers", type=int, default=os.cpu_count(), help="Processes parsing the changed files")
+    args = parser.parse_args()
+    configure_paths_from_args(args)
+
+    start_time = time.time()
+    cache = load_island_cache(workers=args.ingest_workers)
+    print("Cached", len(cache), "islands,", len(cache.verts), "verts, in", cache.cache_dir, "in", str(time.time() - start_time), "seconds")
@@ -0,0 +1,94 @@
+import numpy as np
+import torch
+
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler
+
+from typing import Iterable, Iterator, List, Sequence, Tuple, Union
+
+from Utils import MeshData
+
+
+def stack_island_channels(islands: Sequence[MeshData], max_verts: int = MeshData.MAX_VERTS) -> torch.Tensor:
+    """Stacks the x, y and z channels of every island into one tensor, zero padded or cut to max_verts.
+    Returns:
+        float32 tensor of shape (islands, 3, max_verts)
+    """
+    # Islands read from the IslandCache come with their channels already stacked.
+    cached = getattr(islands, "channels", None)
+    if cached is not None and cached.shape == (len(islands), 3, max_verts):
+        return torch.from_numpy(np.array(cached))
+
+    stacked = np.zeros((len(islands), max_verts, 3), dtype=np.float32)
+    for i, island in enumerate(islands):
+        verts = island.verts[:max_verts]
+        stacked[i, :len(verts)] = verts
+
+    # (islands, verts, xyz) -> (islands, xyz, verts), each channel contiguous.
+    return torch.from_numpy(np.ascontiguousarray(stacked.transpose(0, 2, 1)))
+
+
+# Draws training batches from the true island distribution, as a map-style Dataset.
+#       All islands are stacked into a single (n, channels, 1024) tensor up front, and indexing with a
+#       list of indices returns a whole batch from one gather, so loaders built by make_island_loader()
+#       fetch batches rather than collating single samples.
+class IslandDataset(Dataset):
+
+    def __init__(self, labels: Sequence, islands: Sequence[MeshData], max_verts: int = MeshData.MAX_VERTS):
+        """
+        Args:
+            labels: One label per island, as returned by load_island_data()
+            islands: The island meshes
+            max_verts: Length of each channel
+        """
+        self.labels = torch.tensor(labels, dtype=torch.float32).reshape(-1, 1)
+        self.channels = stack_island_channels(islands, max_verts)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __getitem__(self, index: Union[int, List[int]]) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Returns:
+            labels: (1,)
+            data: (1, max_verts), the x channel
+            channels: (3, max_verts), the x, y and z channels
+            Each batched along the first dimension when index is a list.
+        """
+        if isinstance(index, int):
+            channels = self.channels[index]
+            return self.labels[index], channels[:1], channels
+
+        indices = torch.as_tensor(index, dtype=torch.long)
+        channels = self.channels.index_select(0, indices)
+        return self.labels.index_select(0, indices), channels[:, :1], channels
+
+
+def seed_worker(worker_id: int):
+    # Forked workers share the parent's NumPy random state, give each its own.
+    np.random.seed(torch.initial_seed() % 2**32)
+
+def make_loader(dataset, num_workers: int = 0, pin_memory: bool = False, prefetch_factor: int = 2, **kwargs) -> DataLoader:
+    """Builds a DataLoader whose worker processes prepare batches ahead of the training loop.
+    Args:
+        num_workers: Background worker processes, 0 prepares batches in the training process.
+        pin_memory: Copy batches into page-locked memory, for faster transfers to the GPU.
+        prefetch_factor: Batches each worker keeps ready ahead of the training loop.
+        kwargs: Passed on to DataLoader.
+    """
+    if num_workers > 0:
+        kwargs["prefetch_factor"] = prefetch_factor
+        kwargs["persistent_workers"] = True
+        kwargs["worker_init_fn"] = seed_worker
+
+    return DataLoader(dataset, num_workers=num_workers, pin_memory=pin_memory, **kwargs)
+
+def make_island_loader(dataset: IslandDataset, batch_size: int, **kwargs) -> DataLoader:
+    """Loader of shuffled, full island batches, every island at most once per epoch. See make_loader()."""
+    batches = BatchSampler(RandomSampler(dataset), batch_size, drop_last=len(dataset) >= batch_size)
+    return make_loader(dataset, batch_size=None, sampler=batches, **kwargs)
+
+def endless(loader: Iterable) -> Iterator:
+    """Iterates over a loader epoch after epoch, reshuffling each time."""
+    while True:
+        for batch in loader:
+            yield batch
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from urllib.request import Request, urlopen
+
+from typing import Dict, List, Optional
+
+
+
+# Load test for the /Generate/ endpoint.
+#       Starts AnvilGenerator.py in each requested serving mode, fires concurrent requests at it,
+#       and reports throughput and latency for each, e.g.
+#           python LoadTest.py --modes dev prefork threaded --concurrency 16 --requests 400
+#       Pass --url to test a server that's already running instead.
+
+def make_graph(num_nodes: int) -> Dict:
+    """Builds a random graph in the layout the Unity editor posts: a chain of connected nodes."""
+    nodes = []
+    for index in range(num_nodes):
+        nodes.append({
+            "index": index,
+            "pos": {"x": random.uniform(-100, 100), "y": random.uniform(-100, 100)},
+            "length": random.uniform(1, 10),
+            "width": random.uniform(1, 10),
+            "elevation": random.uniform(0, 5)
+        })
+
+    connections = []
+    for index in range(1, num_nodes):
+        connections.append({
+            "pos": {"x": random.uniform(-100, 100), "y": random.uniform(-100, 100)},
+            "outNode": index - 1,
+            "inNode": index
+        })
+
+    return {"worldPosOffset": {"x": 0, "y": 0}, "nodes": nodes, "connections": connections}
+
+def post(url: str, payload: bytes, accept: str) -> float:
+    start_time = time.time()
+    request = Request(url, data=payload, method="POST",
+        headers={"Content-Type": "application/json", "Accept": accept})
+    with urlopen(request) as response:
+        response.read()
+    return time.time() - start_time
+
+def run_load(url: str, payload: bytes, concurrency: int, num_requests: int, accept: str) -> Dict[str, float]:
+    """Sends num_requests posts from concurrency client threads.
+    Returns:
+        Throughput and latency statistics, latencies in milliseconds.
+    """
+    latencies: List[float] = []
+    errors = [0]
+    remaining = [num_requests]
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            try:
+                latency = post(url, payload, accept)
+                with lock:
+                    latencies.append(latency)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+
+    start_time = time.time()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.time() - start_time
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0
+    }
+
+def wait_for_port(host: str, port: int, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def start_server(mode: str, port: int, args) -> subprocess.Popen:
+    command = [sys.executable, "AnvilGenerator.py",
+        "--serve", mode,
+        "--host", "127.0.0.1",
+        "--port", str(port),
+        "--workers", str(args.workers),
+        "--threads", str(args.threads),
+        "--latency", str(args.latency)
+    ]
+    if args.island_set is not None:
+        command += ["--island-set", args.island_set]
+    here = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.Popen(command, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def print_result(name: str, result: Dict[str, float], baseline: Optional[Dict[str, float]] = None):
+    line = "{:<10} {:>6} ok {:>4} err {:>9.1f} req/s   p50 {:>8.1f} ms   p95 {:>8.1f} ms   max {:>8.1f} ms".format(
+        name, result["requests"], result["errors"], result["requests_per_second"],
+        result["p50_ms"], result["p95_ms"], result["max_ms"])
+    if baseline is not None and baseline["requests_per_second"] > 0:
+        line += "   x{:.2f}".format(result["requests_per_second"] / baseline["requests_per_second"])
+    print(line)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Load test for the /Generate/ endpoint")
+    parser.add_argument("--url", default=None, help="Test a running server instead of starting one per mode")
+    parser.add_argument("--modes", nargs="+", default=["dev", "prefork", "threaded"])
+    parser.add_argument("--port", type=int, default=5105)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--nodes", type=int, default=20, help="Nodes in the posted graph")
+    parser.add_argument("--binary", action="store_true", help="Ask for the binary terrain format")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--island-set", default=None, help="Folder of .obj island meshes, the server's configured one by default")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency injected by the server, seconds")
+    args = parser.parse_args()
+
+    payload = json.dumps(make_graph(args.nodes)).encode("utf-8")
+    accept = "application/x-anvil-terrain" if args.binary else "application/json"
+
+    if args.url is not None:
+        print_result("server", run_load(args.url, payload, args.concurrency, args.requests, accept))
+        sys.exit(0)
+
+    print("Graph of", args.nodes, "nodes,", args.requests, "requests from", args.concurrency, "clients")
+
+    baseline = None
+    for mode in args.modes:
+        server = start_server(mode, args.port, args)
+        try:
+            if not wait_for_port("127.0.0.1", args.port, 60):
+                print(mode, "server did not start")
+                continue
+
+            url = "http://127.0.0.1:" + str(args.port) + "/Generate/"
+
+            # A few requests first, so every worker has its corpus resident before timing.
+            run_load(url, payload, args.concurrency, args.concurrency * 2, accept)
+
+            result = run_load(url, payload, args.concurrency, args.requests, accept)
+            print_result(mode, result, baseline)
+            if baseline is None:
+                baseline = result
+        finally:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,161 @@
+import random
+import threading
+import time
+
+import os
+
+from typing import Dict, List, Optional, Tuple
+
+from AnvilConfig import get_paths
+from FileScanner import FileScanner
+from IslandCache import load_island_cache
+from Utils import WAVEFRONT_EXTENSIONS, MeshData
+
+
+# Process-wide, in-memory store of every island mesh in the IslandSet folder.
+#       Meshes are parsed once and kept resident, so requests never touch the disk.
+#       They're read through the IslandCache, so a restart maps the preprocessed arrays instead of parsing.
+#       Lookups are indexed by file name, vertex count and triangle count.
+class MeshCorpus:
+
+    def __init__(self, directory: Optional[str] = None, refresh_interval: Optional[float] = 5.0, workers: int = 1):
+        """
+        Args:
+            directory: Folder containing the .obj island meshes, the configured island set if None.
+            refresh_interval: Minimum number of seconds between mtime checks made by
+                maybe_refresh(). None disables automatic refreshing.
+            workers: Processes parsing the files that aren't in the island cache yet.
+        """
+        self.directory = directory if directory is not None else get_paths().island_set
+        self.refresh_interval = refresh_interval
+        self.workers = workers
+
+        self.meshes: Dict[str, MeshData] = {}
+        self.stats: Dict[str, os.stat_result] = {}
+        self.names: List[str] = []
+        self.mesh_list: List[MeshData] = []
+        self.by_vert_count: Dict[int, List[str]] = {}
+        self.by_tri_count: Dict[int, List[str]] = {}
+
+        # Hash of the island files' contents, results generated from the corpus are keyed by it.
+        #       Every process reading the same islands gets the same version, so it's safe to share.
+        self.version = ""
+
+        self.loaded = False
+        self.last_check = 0.0
+        self.load_time = 0.0
+
+        self.scanner = FileScanner(self.directory, WAVEFRONT_EXTENSIONS)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _read_meshes(self, stats: Dict[str, os.stat_result]) -> Tuple[Dict[str, MeshData], str]:
+        # The cache re-parses only the files that changed since it was last written, going by this scan.
+        cache = load_island_cache(self.directory, workers=self.workers, stats=stats)
+        return dict(zip(cache.names, cache.meshes())), cache.content_hash()
+
+    def _index(self, meshes: Dict[str, MeshData], version: str):
+        # Build the lookup tables off to the side, then swap them in at once.
+        names = sorted(meshes.keys())
+        by_vert_count = {}
+        by_tri_count = {}
+        for name in names:
+            mesh = meshes[name]
+            by_vert_count.setdefault(len(mesh.verts), []).append(name)
+            by_tri_count.setdefault(len(mesh.indices) // 3, []).append(name)
+
+        self.meshes = meshes
+        self.names = names
+        self.mesh_list = [meshes[name] for name in names]
+        self.by_vert_count = by_vert_count
+        self.by_tri_count = by_tri_count
+        self.version = version
+
+    def load(self):
+        """Reads every mesh in the directory, replacing anything already loaded."""
+        with self._lock:
+            start_time = time.time()
+            stats = self.scanner.scan()
+            self.stats = stats
+            self._index(*self._read_meshes(stats))
+
+            self.loaded = True
+            self.last_check = time.time()
+            self.load_time = self.last_check - start_time
+
+        print("Loaded", len(self), "meshes into corpus in", str(self.load_time), "seconds")
+
+    def reload(self):
+        """Explicitly re-reads the whole corpus from disk."""
+        self.load()
+
+    def refresh(self) -> List[str]:
+        """Re-parses only the files that were added or modified since the last load,
+            and drops files that were removed.
+        Returns:
+            The names of the files that changed.
+        """
+        if not self.loaded:
+            self.load()
+            return list(self.names)
+
+        with self._lock:
+            stats = self.scanner.scan()
+            changed, removed = FileScanner.changes(self.stats, stats)
+
+            if changed or removed:
+                self.stats = stats
+                self._index(*self._read_meshes(stats))
+
+            self.last_check = time.time()
+
+        if changed or removed:
+            print("Corpus refreshed:", len(changed), "changed,", len(removed), "removed")
+
+        return changed + removed
+
+    def maybe_refresh(self):
+        """Loads the corpus on first use, then checks mtimes at most once per refresh_interval."""
+        if not self.loaded:
+            self.load()
+        elif self.refresh_interval is not None and time.time() - self.last_check >= self.refresh_interval:
+            self.refresh()
+
+    # LOOKUPS
+    def get(self, name: str) -> Optional[MeshData]:
+        return self.meshes.get(name)
+
+    def with_vert_count(self, count: int) -> List[MeshData]:
+        meshes = self.meshes
+        return [meshes[name] for name in self.by_vert_count.get(count, [])]
+
+    def with_tri_count(self, count: int) -> List[MeshData]:
+        meshes = self.meshes
+        return [meshes[name] for name in self.by_tri_count.get(count, [])]
+
+    def all_meshes(self) -> List[MeshData]:
+        return list(self.mesh_list)
+
+    def random_mesh(self, rng: Optional[random.Random] = None) -> MeshData:
+        """Any mesh, picked by rng, or the random module if None."""
+        return (rng or random).choice(self.mesh_list)
+
+
+# The single corpus shared by every request in this process.
+_corpus: Optional[MeshCorpus] = None
+
+def get_corpus() -> MeshCorpus:
+    global _corpus
+    if _corpus is None:
+        _corpus = MeshCorpus()
+    return _corpus
+
+def configure_corpus(directory: Optional[str] = None, refresh_interval: Optional[float] = 5.0, workers: int = 1) -> MeshCorpus:
+    """Replaces the shared corpus with one reading from the given directory.
+        Meant to be called once at startup, before any request is served.
+    """
+    global _corpus
+    _corpus = MeshCorpus(directory, refresh_interval, workers)
+    return _corpus
@@ -0,0 +1,125 @@
+import pickle
+import threading
+import time
+
+from os.path import exists, getmtime
+
+from typing import TYPE_CHECKING, Dict, Optional
+
+# torch is only imported once a model is loaded.
+if TYPE_CHECKING:
+    import torch.nn as nn
+
+
+VERT_GEN_MODEL = "vert_gen.model"
+
+
+def load_model(path: str) -> "nn.Module":
+    import torch.nn as nn
+    from InferenceRuntime import is_runtime_artifact, load_runtime
+
+    # TorchScript and ONNX artifacts run as they are, without building a model from Models.
+    if is_runtime_artifact(path):
+        return load_runtime(path)
+
+    from Checkpoint import is_export, model_from_export, torch_load
+
+    # Exports from export_model() hold only weights, and load without unpickling any classes.
+    try:
+        data = torch_load(path, weights_only=True)
+    except (pickle.UnpicklingError, RuntimeError):
+        data = None
+
+    if is_export(data):
+        return model_from_export(data)
+    if isinstance(data, nn.Module):
+        return data
+
+    # Model files from before exports pickle the whole module, unpickle it onto the cpu.
+    return torch_load(path, weights_only=False)
+
+
+# Process-wide store of the trained models used for inference.
+#       Each model is read from disk once, put in eval mode and kept resident.
+#       A model is re-read when its file's modified time changes.
+class ModelRegistry:
+
+    def __init__(self, refresh_interval: Optional[float] = 5.0):
+        """
+        Args:
+            refresh_interval: Minimum number of seconds between mtime checks for a model.
+                None disables hot reloading.
+        """
+        self.refresh_interval = refresh_interval
+
+        self.models: Dict[str, "nn.Module"] = {}
+        self.mtimes: Dict[str, float] = {}
+        self.last_check: Dict[str, float] = {}
+        self.load_times: Dict[str, float] = {}
+        self.total_load_time = 0.0
+
+        self._lock = threading.Lock()
+
+    def __contains__(self, path: str):
+        return path in self.models
+
+    def load(self, path: str) -> "nn.Module":
+        """Reads the model at path from disk, replacing any resident copy."""
+        with self._lock:
+            start_time = time.time()
+            mtime = getmtime(path)
+
+            model = load_model(path)
+            model.eval()
+
+            self.models[path] = model
+            self.mtimes[path] = mtime
+            self.last_check[path] = time.time()
+            self.load_times[path] = self.last_check[path] - start_time
+            self.total_load_time += self.load_times[path]
+
+        print("Loaded model", path, "in", str(self.load_times[path]), "seconds")
+        return model
+
+    def warm(self, path: str) -> bool:
+        """Loads a model ahead of the first request, if its file exists.
+        Returns:
+            True if the model is resident.
+        """
+        if not exists(path):
+            print("Model", path, "not found, it will be loaded on first use")
+            return False
+
+        self.get(path)
+        return True
+
+    def get(self, path: str) -> "nn.Module":
+        """Returns the resident model, loading it on first use and reloading it when its file changed."""
+        model = self.models.get(path)
+        if model is None:
+            return self.load(path)
+
+        now = time.time()
+        if self.refresh_interval is not None and now - self.last_check[path] >= self.refresh_interval:
+            self.last_check[path] = now
+            if exists(path) and getmtime(path) != self.mtimes[path]:
+                return self.load(path)
+
+        return model
+
+    def version(self, path: str) -> Optional[float]:
+        """Modified time of the file the resident model was read from, None before it's loaded."""
+        return self.mtimes.get(path)
+
+    def load_time(self, path: str) -> float:
+        return self.load_times.get(path, 0.0)
+
+
+# The single registry shared by every request in this process.
+_registry: Optional[ModelRegistry] = None
+
+def get_registry() -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
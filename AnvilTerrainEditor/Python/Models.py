@@ -7,6 +7,20 @@ import math
 
 from typing import Optional
 
+from TrainingArguments import PRECISIONS
+
+def precision_autocast(precision: str):
+    """Context manager running the enclosed forward passes at the given precision."""
+    if precision not in PRECISIONS:
+        raise ValueError("Unknown precision " + str(precision) + ", expected one of " + ", ".join(PRECISIONS))
+    return torch.autocast("cpu", dtype=torch.bfloat16, enabled=precision == "bf16")
+
+def to_channels_last(model: nn.Module) -> nn.Module:
+    """Converts a conv model's 4D weights to channels_last (NHWC) in place, so its convolutions
+        run NHWC from then on, whatever the layout of their input.
+    """
+    return model.to(memory_format=torch.channels_last)
+
 # Generators
 class EvenGenerator(nn.Module):
 
@@ -24,6 +38,9 @@ class VertGenerator(nn.Module):
     def __init__(self, input_length: int):
         super(VertGenerator, self).__init__()
 
+        # Shape of one sample of input noise
+        self.noise_shape = (1024,)
+
         # DC Layers
         self.layers_list = []
         # self.layers_list.append(nn.Linear(in_features=(1024*3), out_features=(1024*3)))
@@ -42,6 +59,10 @@ class VertGenerator(nn.Module):
         return x
 
 
+# Convolutional vert generator.
+#       Noise of input_length values, e.g. (batch, channels, 32, 32), is projected to a small
+#       num_base_filters deep feature map, upsampled twice and convolved back down to n_channels
+#       images at the full resolution, one channel per vertex coordinate.
 class DCVertGenerator(nn.Module):
     def __init__(self, input_length: int, n_channels: int,  num_base_filters: Optional[int]):
         super(DCVertGenerator, self).__init__()
@@ -54,33 +75,38 @@ class DCVertGenerator(nn.Module):
         if self.num_base_filters is None:
             self.num_base_filters = 32 * 2 ** number_of_layers
 
+        # The output images are square, at the resolution the noise was drawn at.
+        self.n_channels = n_channels
+        self.resolution = int(round(math.sqrt(input_length / n_channels)))
+        if self.resolution * self.resolution * n_channels != input_length or self.resolution % 4 != 0:
+            raise ValueError("input_length " + str(input_length) + " isn't " + str(n_channels) + " square channels with a side divisible by 4")
+        self.base_resolution = self.resolution // 4
+        self.noise_shape = (n_channels, self.resolution, self.resolution)
+
+        # Add the initial layer, noise to a (num_base_filters, resolution/4, resolution/4) feature map
+        self.dense = nn.Linear(input_length, self.num_base_filters * self.base_resolution * self.base_resolution)
+
         # Create the list to hold all sequential layers
         self.layers_list = []
 
-        # Add the initial layer
-        self.layers_list.append(nn.Linear(input_length, num_base_filters))
-        self.layers_list.append(nn.ReLU())
-
-        # Add a scaled number of layers
         # We apply batch normalization after each layer to reduce covariant shift
-        self.layers_list.append(nn.BatchNorm2d(n_channels))
+        self.layers_list.append(nn.BatchNorm2d(self.num_base_filters))
+        self.layers_list.append(nn.ReLU())
         self.layers_list.append(nn.Upsample(scale_factor=2))
 
         # First Convolution layer
-        self.layers_list.append(nn.Conv2d(n_channels, 32, 32, stride=1, padding=1))
+        self.layers_list.append(nn.Conv2d(self.num_base_filters, 32, 3, stride=1, padding=1))
         self.layers_list.append(nn.BatchNorm2d(32, 0.8))
         self.layers_list.append(nn.LeakyReLU(0.2, inplace=True))
         self.layers_list.append(nn.Upsample(scale_factor=2))
-        
+
         # Second Convolution
-        self.layers_list.append(nn.Conv2d(32, 16, n_channels, stride=1, padding=1))
+        self.layers_list.append(nn.Conv2d(32, 16, 3, stride=1, padding=1))
         self.layers_list.append(nn.BatchNorm2d(16, 0.8))
         self.layers_list.append(nn.LeakyReLU(0.2, inplace=True))
 
         # Third convolution
-        self.layers_list.append(nn.Conv2d(16, n_channels, n_channels, stride=1, padding=1))
-        self.layers_list.append(nn.BatchNorm2d(16, 0.8))
-        self.layers_list.append(nn.LeakyReLU(0.2, inplace=True))
+        self.layers_list.append(nn.Conv2d(16, n_channels, 3, stride=1, padding=1))
 
         # Final activation, Hardtan between max and min distance from origin (in this case 10)
         self.layers_list.append(nn.Hardtanh(-10.0, 10.0))
@@ -88,6 +114,9 @@ class DCVertGenerator(nn.Module):
         self.layers = nn.ModuleList(self.layers_list)
 
     def forward(self, x):
+        # Any noise layout works, as long as it holds input_length values per sample.
+        x = self.dense(x.reshape(x.shape[0], -1))
+        x = x.view(x.shape[0], self.num_base_filters, self.base_resolution, self.base_resolution)
         for i, layer in enumerate(self.layers):
             x = layer(x)
         return x
@@ -121,9 +150,12 @@ class Discriminator(nn.Module):
         return self.model(x)
         return self.activation(self.dense(x))
 
+# Convolutional discriminator over (batch, input_channels, image_size, image_size) vert images.
+#       Four stride 2 convolutions bring the image down by 16 before a dense layer scores it.
 class DCVertDiscriminator(nn.Module):
     def __init__(self, image_size: int, input_channels: int):
         super(DCVertDiscriminator, self).__init__()
+        final_size = (image_size + 15) // 16
         self.model = nn.Sequential(
             nn.Conv2d(input_channels, 32, 3, stride=2, padding=1),
             nn.ELU(),
@@ -136,9 +168,10 @@ class DCVertDiscriminator(nn.Module):
             nn.BatchNorm2d(128, 0.8),
             nn.Conv2d(128, input_channels, 3, stride=2, padding=1),
             nn.ELU(),
-            nn.Linear(2, 1),
+            nn.Flatten(),
+            nn.Linear(input_channels * final_size * final_size, 1),
             nn.Sigmoid()
         )
 
     def forward(self, x):
-        return self.model(x)
\ No newline at end of file
+        return self.model(x)
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import threading
+
+from collections import OrderedDict
+from os.path import join
+
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+# Serialized /Generate/ responses, by the graph they were generated from.
+#       A response is only reusable when the request would generate it again, so the key covers
+#       the canonical graph, the seed, the corpus and model versions, and the response format.
+#       Entries are kept in memory, least recently used evicted first past max_bytes, and
+#       optionally on disk too, where prefork workers and restarted servers share them.
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def canonical_graph(nodes: List[Dict], connections: List[Dict]) -> bytes:
+    # Islands are generated by their index, so node order doesn't change the response.
+    #       Bridges are returned in the order they're sent, so connection order does.
+    nodes = sorted(nodes, key=lambda node: node.get("index", 0))
+    return json.dumps({"nodes": nodes, "connections": connections}, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+def graph_key(nodes: List[Dict], connections: List[Dict], seed: int, version: str, variant: str = "") -> str:
+    """Content address of a response.
+    Args:
+        seed: Seed the graph is generated with
+        version: What else the response depends on, e.g. the corpus and model versions
+        variant: Response format, e.g. its mimetype
+    """
+    digest = hashlib.sha256(canonical_graph(nodes, connections))
+    digest.update(json.dumps([seed, version, variant]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, disk_dir: Optional[str] = None, disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES):
+        """
+        Args:
+            max_bytes: Total size of the responses kept in memory, 0 disables the cache
+            disk_dir: Folder of the disk tier, None keeps responses in memory only
+            disk_max_bytes: Total size of the responses kept in disk_dir
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+        # Statistics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _disk_path(self, key: str) -> str:
+        return join(self.disk_dir, key + ".bin")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The cached response for key, from memory, or from disk and then kept in memory, None on a miss."""
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body
+
+        body = self._read_disk(key)
+        with self._lock:
+            if body is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, body)
+        return body
+
+    def put(self, key: str, body: bytes):
+        with self._lock:
+            self._store(key, body)
+        self._write_disk(key, body)
+
+    def cache_chunks(self, key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Passes a streamed response through, caching it once it's been sent in full."""
+        sent = []
+        for chunk in chunks:
+            chunk = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            sent.append(chunk)
+            yield chunk
+        self.put(key, b"".join(sent))
+
+    def bypass(self):
+        """Counts a request that couldn't use the cache, e.g. one without a seed."""
+        with self._lock:
+            self.bypassed += 1
+
+    def _store(self, key: str, body: bytes):
+        # Called with the lock held. Responses bigger than the whole cache only go to disk.
+        if len(body) > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= len(previous)
+        self._entries[key] = body
+        self.bytes += len(body)
+
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+    # DISK TIER
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as file:
+                body = file.read()
+            # Used entries are touched, so the disk tier evicts least recently used too.
+            os.utime(path)
+            return body
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, body: bytes):
+        if self.disk_dir is None or len(body) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        temp_path = path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(body)
+            os.replace(temp_path, path)
+            self._trim_disk()
+        except OSError as ex:
+            print("Result cache entry not written to", self.disk_dir, ex)
+
+    def _trim_disk(self):
+        entries = []
+        with os.scandir(self.disk_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith(".bin"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "disk": self.disk_dir is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+# The single result cache shared by every request in this process.
+_result_cache: Optional[ResultCache] = None
+
+def get_result_cache() -> ResultCache:
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
+
+def configure_result_cache(max_bytes: int = DEFAULT_MAX_BYTES, disk_dir: Optional[str] = None, disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES) -> ResultCache:
+    """Replaces the shared result cache.
+        Meant to be called once at startup, before any request is served.
+    """
+    global _result_cache
+    _result_cache = ResultCache(max_bytes, disk_dir, disk_max_bytes)
+    return _result_cache
@@ -0,0 +1,105 @@
+import os
+import sys
+
+from typing import Callable, Optional
+
+
+# Ways of serving the Flask app.
+#       dev:      Flask's built-in development server, a single process.
+#       prefork:  gunicorn master with a number of forked worker processes (Linux/macOS).
+#       threaded: waitress, whose async accept loop hands requests to a pool of worker threads,
+#                 so a slow generation never blocks new connections (Windows friendly).
+SERVE_MODES = ["dev", "prefork", "threaded"]
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 105
+DEFAULT_WORKERS = 4
+DEFAULT_THREADS = 8
+
+
+def serve_dev(app, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, on_start: Optional[Callable] = None):
+    if on_start is not None:
+        on_start()
+
+    app.run(host=host, port=port)
+
+def serve_prefork(app,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    workers: int = DEFAULT_WORKERS,
+    threads: int = 1,
+    on_start: Optional[Callable] = None
+):
+    """Serves the app from several forked worker processes.
+    Args:
+        workers: Number of worker processes, each with its own corpus and model.
+        threads: Request threads per worker.
+        on_start: Called once in every worker after it forks, to load the corpus and model.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise ImportError("Prefork serving needs gunicorn, install it with: pip install gunicorn")
+
+    # Split the cores between the workers, rather than every worker's torch claiming all of them.
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    def post_worker_init(worker):
+        # torch reads OMP_NUM_THREADS when it's first imported, which may be later or never.
+        os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(torch_threads)
+        if on_start is not None:
+            on_start()
+
+    class PreforkApplication(BaseApplication):
+
+        def load_config(self):
+            self.cfg.set("bind", host + ":" + str(port))
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("post_worker_init", post_worker_init)
+
+            # Generation can take a while on big graphs, don't let the master kill busy workers.
+            self.cfg.set("timeout", 120)
+
+        def load(self):
+            return app
+
+    print("Serving with", workers, "prefork workers on", host + ":" + str(port))
+    PreforkApplication().run()
+
+def serve_threaded(app,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    threads: int = DEFAULT_THREADS,
+    on_start: Optional[Callable] = None
+):
+    """Serves the app from one process, generating on a pool of worker threads.
+        Torch and NumPy release the GIL for the heavy lifting, so requests overlap.
+    Args:
+        threads: Number of worker threads.
+        on_start: Called once before serving, to load the corpus and model.
+    """
+    try:
+        from waitress import serve
+    except ImportError:
+        raise ImportError("Threaded serving needs waitress, install it with: pip install waitress")
+
+    if on_start is not None:
+        on_start()
+
+    print("Serving with", threads, "threads on", host + ":" + str(port))
+    serve(app, host=host, port=port, threads=threads)
+
+def serve(app, mode: str = "dev", host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+    workers: int = DEFAULT_WORKERS, threads: int = DEFAULT_THREADS, on_start: Optional[Callable] = None):
+
+    if mode == "dev":
+        serve_dev(app, host, port, on_start)
+    elif mode == "prefork":
+        serve_prefork(app, host, port, workers, on_start=on_start)
+    elif mode == "threaded":
+        serve_threaded(app, host, port, threads, on_start)
+    else:
+        raise ValueError("Unknown serve mode " + str(mode) + ", expected one of " + ", ".join(SERVE_MODES))
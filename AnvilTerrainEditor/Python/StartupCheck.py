@@ -0,0 +1,81 @@
+import argparse
+import os
+import subprocess
+import sys
+
+from typing import List, Tuple
+
+
+# Checks that the server starts fast: importing AnvilGenerator must stay clear of torch and the
+#       training stack, which are only imported once a model is used, and within a time budget.
+#       The import runs under python -X importtime in a fresh interpreter, so torch needn't be installed.
+#       Exits with status 1 naming what went wrong.
+#           python StartupCheck.py
+#           python StartupCheck.py --budget 0.5
+
+LAZY_MODULES = ["torch", "matplotlib", "Models", "Generator"]
+STARTUP_BUDGET = 1.0 # Seconds for importing AnvilGenerator
+
+# Imports the module, then prints which of the lazy modules it brought into sys.modules.
+IMPORT_SCRIPT = """
+import sys
+import {module}
+print(",".join(name for name in {lazy!r} if name in sys.modules))
+"""
+
+
+def import_times(module: str) -> Tuple[List[Tuple[int, str, float, float]], List[str]]:
+    """Imports module in a fresh interpreter under python -X importtime.
+    Returns:
+        times: (depth, name, self seconds, cumulative seconds) of every module imported, in import order.
+        eager: The LAZY_MODULES that importing module put in sys.modules.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT.format(module=module, lazy=LAZY_MODULES)],
+        cwd=here, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError("Importing " + module + " failed:\n" + result.stderr.splitlines()[-1])
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative_time, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        times.append((depth, name.strip(), int(self_time) / 1e6, int(cumulative_time) / 1e6))
+
+    eager = [name for name in result.stdout.strip().split(",") if name]
+    return times, eager
+
+def check_startup(module: str = "AnvilGenerator", budget: float = STARTUP_BUDGET, verbose: bool = True) -> float:
+    """Raises an AssertionError if importing module imports any of LAZY_MODULES, or takes over budget seconds.
+    Returns:
+        The seconds importing module took.
+    """
+    times, eager = import_times(module)
+    total_time = next(cumulative for _, name, _, cumulative in times if name == module)
+
+    if verbose:
+        print("{:<40} {:>10.1f} ms".format("import " + module, total_time * 1000))
+        direct = sorted((entry for entry in times if entry[0] == 1), key=lambda entry: -entry[3])
+        for _, name, _, cumulative in direct[:8]:
+            print("    {:<36} {:>10.1f} ms".format(name, cumulative * 1000))
+
+    # Raised rather than asserted, so the check still runs under python -O.
+    if eager:
+        raise AssertionError("Importing " + module + " imports " + ", ".join(eager) + ", these must be imported lazily")
+    if total_time > budget:
+        raise AssertionError("Importing " + module + " took " + str(total_time) + " seconds, over the budget of " + str(budget))
+    return total_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that the Anvil server's imports stay light")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="Seconds importing AnvilGenerator may take")
+    args = parser.parse_args()
+
+    try:
+        check_startup(budget=args.budget)
+    except AssertionError as ex:
+        print(ex)
+        sys.exit(1)
+    print("Importing AnvilGenerator leaves", ", ".join(LAZY_MODULES), "unimported, within", args.budget, "seconds")
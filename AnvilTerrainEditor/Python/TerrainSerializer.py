@@ -0,0 +1,271 @@
+import struct
+
+import numpy as np
+
+from typing import Iterable, Iterator, List, Tuple
+
+# Serializes generated terrain into the JSON layout read by Unity's JsonUtility.FromJson
+#       { "terrain" : [ {"worldPos":{"x":1,"y":0,"z":1}, "verts":[{"x":5.4,"y":3.8,"z":2.1}, ...], "indices":[0, 1, 2]}, ... ] }
+#
+#       Each array is formatted in one pass from its NumPy buffer, and every piece is written
+#       once, either joined into a single buffer or yielded as chunks for a streamed response.
+
+TERRAIN_HEADER = '{ "terrain" : [ '
+TERRAIN_FOOTER = ' ] }'
+VERT_TEMPLATE = '{"x":%r,"y":%r,"z":%r}'
+
+JSON_MIMETYPE = 'application/json'
+BINARY_MIMETYPE = 'application/x-anvil-terrain'
+
+# Binary layout, little-endian throughout. Every block starts on a 4 byte boundary.
+#       Header:     magic "ANVL", uint16 version, uint16 reserved, uint32 mesh count
+#       Per mesh:   float32[3] worldPos, uint32 vert count, uint32 index count,
+#                   uint8 index width (2 or 4), 3 bytes padding,
+#                   float32[vert count * 3] verts, uint16/uint32[index count] indices, padding
+BINARY_MAGIC = b'ANVL'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sHHI')
+BINARY_MESH_HEADER = struct.Struct('<3fIIB3x')
+
+POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+SCALES = 10.0 ** np.arange(-45, 46) # SCALES[45 + k] == 10^k, covers the float32 range
+POSITIONAL_LIMIT = 1e16 # Larger values go through repr()
+
+
+def shortest_decimal(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Finds the shortest decimal that maps back onto each float32, the same digits numpy and
+        repr() print for it, as |value| == mantissa * 10^-power.
+    Args:
+        values: Flat array of finite float32 values
+    Returns:
+        mantissa: int64 significant digits, without trailing zeros
+        power: int64 decimal shift
+    """
+    target = np.abs(values)
+    wide = target.astype(np.float64)
+    exponent = np.floor(np.log10(np.where(wide == 0, 1.0, wide))).astype(np.int64)
+
+    mantissa = np.zeros(len(values), dtype=np.int64)
+    power = np.zeros(len(values), dtype=np.int64)
+
+    # Round to 1, 2, ... significant digits, keeping the first rounding that maps back onto
+    #       the float32. Nine digits always do, the tenth only covers log10 rounding.
+    pending = np.arange(len(values))
+    for digits in range(10):
+        shift = digits - exponent[pending]
+        scale = SCALES[45 + shift]
+        rounded = np.round(wide[pending] * scale)
+        matched = (rounded / scale).astype(np.float32) == target[pending]
+
+        mantissa[pending[matched]] = rounded[matched]
+        power[pending[matched]] = shift[matched]
+        pending = pending[~matched]
+        if len(pending) == 0:
+            break
+
+    # Rounding up can leave trailing zeros behind (9.96 -> 10), drop them.
+    for _ in range(9):
+        trailing = (mantissa != 0) & (mantissa % 10 == 0)
+        if not trailing.any():
+            break
+        mantissa[trailing] //= 10
+        power[trailing] -= 1
+
+    return mantissa, power
+
+def shortest_float32(values: np.ndarray) -> np.ndarray:
+    """Maps float32 values onto the float64 nearest to their shortest round-tripping decimal.
+        Python's repr() of the result prints the same digits numpy prints for the float32,
+        e.g. 2.690919 rather than 2.690918922424316.
+    """
+    shape = np.shape(values)
+    values = np.asarray(values, dtype=np.float32).reshape(-1)
+    finite = np.isfinite(values)
+
+    mantissa, power = shortest_decimal(np.where(finite, values, 0))
+    result = np.where(power >= 0, mantissa / SCALES[45 + power], mantissa * SCALES[45 - power])
+    result = np.where(np.signbit(values), -result, result)
+
+    return np.where(finite, result, values).reshape(shape)
+
+def format_float32(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Formats float32 values in plain positional notation with their shortest digits
+        (2.690919, -3.0, 0.00001), all at once.
+        Every value is laid out in the same columns: sign, integer digits, '.', fraction digits,
+        and the mask marks which of those columns value i actually prints.
+    Args:
+        values: Flat array of finite float32 values below POSITIONAL_LIMIT
+    Returns:
+        chars: uint8 array of shape (N, columns)
+        mask: bool array of shape (N, columns)
+    """
+    mantissa, power = shortest_decimal(values)
+    count = len(values)
+
+    # Split each mantissa into its digits, column j holding the 10^j digit, plus a zero column.
+    mantissa_digits = np.zeros((count, 11), dtype=np.uint8)
+    remaining = mantissa.copy()
+    for j in range(10):
+        mantissa_digits[:, j] = remaining % 10
+        remaining //= 10
+    num_digits = np.maximum(np.searchsorted(POWERS_OF_TEN, mantissa, side='right'), 1)
+
+    # Highest integer place printed (at least the units), and number of decimals (at least one).
+    top_place = np.maximum(num_digits - 1 - power, 0)
+    decimals = np.maximum(power, 1)
+
+    # Place value of every printed column, e.g. [2, 1, 0, -1, -2 ... ], and the mantissa
+    #       digit that lands in it (the zero column when it falls outside the mantissa).
+    places = np.arange(int(top_place.max()), -int(decimals.max()) - 1, -1, dtype=np.int16)
+    digit_index = power.astype(np.int16)[:, None] + places[None, :]
+    digit_index[(digit_index < 0) | (digit_index > 9)] = 10
+    digits = np.take_along_axis(mantissa_digits, digit_index, axis=1) + ord('0')
+
+    point = int(np.count_nonzero(places >= 0))
+    chars = np.empty((count, len(places) + 2), dtype=np.uint8)
+    chars[:, 0] = ord('-')
+    chars[:, 1:point + 1] = digits[:, :point]
+    chars[:, point + 1] = ord('.')
+    chars[:, point + 2:] = digits[:, point:]
+
+    mask = np.empty(chars.shape, dtype=bool)
+    mask[:, 0] = np.signbit(values)
+    mask[:, 1:point + 1] = places[None, :point] <= top_place[:, None]
+    mask[:, point + 1] = True
+    mask[:, point + 2:] = -places[None, point:] <= decimals[:, None]
+
+    return chars, mask
+
+def join_rows(segments: List, count: int) -> Tuple[bytes, np.ndarray]:
+    """Concatenates, row by row, fixed byte strings and (chars, mask) pairs from format_float32,
+        keeping only the masked characters of each row.
+    Returns:
+        The joined bytes, and the length of each row within them.
+    """
+    matrices = []
+    masks = []
+    for segment in segments:
+        if isinstance(segment, bytes):
+            constant = np.frombuffer(segment, dtype=np.uint8)
+            matrices.append(np.broadcast_to(constant, (count, len(constant))))
+            masks.append(np.ones((count, len(constant)), dtype=bool))
+        else:
+            matrices.append(segment[0])
+            masks.append(segment[1])
+
+    mask = np.concatenate(masks, axis=1)
+    return np.concatenate(matrices, axis=1)[mask].tobytes(), mask.sum(axis=1)
+
+def format_vert_list(verts: np.ndarray) -> str:
+    # "{"x":5.4,"y":3.8,"z":2.1}, {"x":1.2,"y":0.52,"z":-2.1}"
+    verts = np.asarray(verts).reshape(-1, 3)
+    if len(verts) == 0:
+        return ''
+
+    if verts.dtype == np.float32 and (np.abs(verts) < POSITIONAL_LIMIT).all():
+        chars, mask = format_float32(verts.reshape(-1))
+        chars = chars.reshape(len(verts), 3, -1)
+        mask = mask.reshape(len(verts), 3, -1)
+
+        packed, row_lengths = join_rows([
+            b'{"x":', (chars[:, 0], mask[:, 0]),
+            b',"y":', (chars[:, 1], mask[:, 1]),
+            b',"z":', (chars[:, 2], mask[:, 2]),
+            b'}, '
+        ], len(verts))
+
+        # repr() prints coordinates below 1e-4 in scientific notation (9.7e-05), those few rows
+        #       are re-formatted through it and spliced back in.
+        special = np.flatnonzero(((verts != 0) & (np.abs(verts) < 1e-4)).any(axis=1))
+        if len(special):
+            row_ends = np.cumsum(row_lengths)
+            row_starts = row_ends - row_lengths
+
+            pieces = []
+            previous = 0
+            for row, values in zip(special, shortest_float32(verts[special]).tolist()):
+                pieces.append(packed[previous:row_starts[row]])
+                pieces.append((VERT_TEMPLATE % tuple(values) + ', ').encode('ascii'))
+                previous = row_ends[row]
+            pieces.append(packed[previous:])
+            packed = b''.join(pieces)
+
+        return packed[:-2].decode('ascii')
+
+    # Float64 verts already print their shortest decimal through repr().
+    if verts.dtype == np.float32:
+        values = shortest_float32(verts)
+    else:
+        values = verts.astype(np.float64)
+
+    template = ', '.join([VERT_TEMPLATE] * len(verts))
+    return template % tuple(values.reshape(-1).tolist())
+
+def format_index_list(indices: np.ndarray) -> str:
+    # "0, 1, 2", Python's list repr already uses this separator.
+    return str(np.asarray(indices).reshape(-1).tolist())[1:-1]
+
+def format_vector3(vector) -> str:
+    # Vector3 components are plain Python numbers, kept exactly as str() prints them.
+    return '{"x":' + str(vector.x) + ',"y":' + str(vector.y) + ',"z":' + str(vector.z) + '}'
+
+def mesh_chunks(mesh) -> List[str]:
+    return [
+        '{"worldPos":', format_vector3(mesh.worldPos), ', ',
+        '"verts":[', format_vert_list(mesh.verts), '], ',
+        '"indices":[', format_index_list(mesh.indices), ']',
+        '}'
+    ]
+
+def mesh_to_json(mesh) -> str:
+    return ''.join(mesh_chunks(mesh))
+
+def iter_terrain_json(terrainMesh: Iterable) -> Iterator[str]:
+    """Yields the terrain response one mesh at a time, suitable for a streamed (chunked) response."""
+    yield TERRAIN_HEADER
+
+    for count, terrain in enumerate(terrainMesh):
+        if count > 0:
+            yield ', '
+        yield mesh_to_json(terrain)
+
+    yield TERRAIN_FOOTER
+
+def serialize_terrain(terrainMesh: Iterable) -> bytes:
+    """Builds the full terrain response in a single buffer."""
+    return ''.join(iter_terrain_json(terrainMesh)).encode('utf-8')
+
+
+def mesh_binary_chunks(mesh) -> List[bytes]:
+    verts = np.ascontiguousarray(np.asarray(mesh.verts).reshape(-1, 3), dtype='<f4')
+    indices = np.asarray(mesh.indices).reshape(-1)
+
+    # Most meshes fit their indices in 16 bits, halving the index block.
+    if len(indices) == 0 or indices.max() <= 0xFFFF:
+        indices = indices.astype('<u2')
+    else:
+        indices = indices.astype('<u4')
+
+    pos = mesh.worldPos
+    chunks = [
+        BINARY_MESH_HEADER.pack(pos.x, pos.y, pos.z, len(verts), len(indices), indices.itemsize),
+        verts.tobytes(),
+        indices.tobytes()
+    ]
+
+    padding = -indices.nbytes % 4
+    if padding:
+        chunks.append(bytes(padding))
+    return chunks
+
+def iter_terrain_binary(terrainMesh: Iterable) -> Iterator[bytes]:
+    """Yields the binary terrain response, the header first and then one mesh at a time."""
+    terrainMesh = list(terrainMesh)
+    yield BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, len(terrainMesh))
+
+    for terrain in terrainMesh:
+        yield b''.join(mesh_binary_chunks(terrain))
+
+def serialize_terrain_binary(terrainMesh: Iterable) -> bytes:
+    """Builds the full binary terrain response in a single buffer."""
+    return b''.join(iter_terrain_binary(terrainMesh))
@@ -0,0 +1,37 @@
+import os
+
+
+# Training options shared by the command lines of Generator.py and AnvilGenerator.py.
+#       Kept apart from the training code, so parsing a command line doesn't import torch.
+
+# The vert GAN is either the linear VertGenerator / Discriminator pair or the convolutional
+#       DCVertGenerator / DCVertDiscriminator pair, which trains on 4D (batch, channels, 32, 32) images.
+VERT_MODEL_TYPES = ["linear", "dc"]
+
+# Numeric precisions models train and run inference at. bf16 runs matmuls and convolutions under
+#       CPU autocast in bfloat16, the weights and optimizer state stay float32.
+PRECISIONS = ["fp32", "bf16"]
+
+
+def add_training_arguments(parser):
+    parser.add_argument("--headless", action="store_true",
+        help="No console output or plot windows, log metrics and write plots to files instead")
+    parser.add_argument("--log-file", default="training_log.jsonl", help="Structured (JSON lines) training log")
+    parser.add_argument("--log-every", type=int, default=100, help="Training steps between log records")
+    parser.add_argument("--plot-dir", default="plots", help="Folder the loss plots are written to")
+    parser.add_argument("--num-workers", type=int, default=0, help="Background data loading processes")
+    parser.add_argument("--ingest-workers", type=int, default=int(os.environ.get("ANVIL_INGEST_WORKERS", os.cpu_count() or 1)),
+        help="Processes parsing island .obj files that aren't in the island cache yet")
+    parser.add_argument("--metrics-dir", default=None, help="Folder the per-step losses are exported to")
+    parser.add_argument("--metrics-format", choices=["npz", "csv"], default="npz")
+    parser.add_argument("--checkpoint-dir", default="checkpoints", help="Folder vert training checkpoints are written to")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="Training steps between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="Carry on from the newest checkpoint")
+    parser.add_argument("--intra-op-threads", type=int, default=None, help="Torch threads for a single op")
+    parser.add_argument("--inter-op-threads", type=int, default=None, help="Torch threads running independent ops")
+    parser.add_argument("--world-size", type=int, default=1,
+        help="Processes training the vert GAN data parallel over gloo, 1 trains in this process")
+    parser.add_argument("--model", choices=VERT_MODEL_TYPES, default="linear", help="Vert GAN to train, linear or DC (convolutional)")
+    parser.add_argument("--precision", choices=PRECISIONS, default=os.environ.get("ANVIL_PRECISION", "fp32"),
+        help="Training and inference precision, bf16 runs under CPU autocast")
+    parser.add_argument("--channels-last", action="store_true", help="Run the DC models in channels_last memory format")
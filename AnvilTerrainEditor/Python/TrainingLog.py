@@ -0,0 +1,207 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# Running training metrics, kept in preallocated ring buffers on the same device as the losses.
+#       Recording a step only copies the loss tensors into their slot, nothing is brought back
+#       to the host until the metrics are read, e.g. at a logging interval or for export.
+#       Once capacity steps are recorded, the oldest are overwritten.
+class MetricsAccumulator:
+
+    def __init__(self, names: Sequence[str], capacity: int = 10000, device: Optional[torch.device] = None):
+        """
+        Args:
+            names: Name of every metric, e.g. ["g_loss", "d_loss"]
+            capacity: Number of most recent steps kept.
+            device: Device of the recorded tensors, the cpu by default.
+        """
+        self.names = list(names)
+        self.capacity = max(1, capacity)
+        self.count = 0
+
+        self.values = torch.zeros(self.capacity, len(self.names), device=device)
+        self.steps = torch.zeros(self.capacity, dtype=torch.int64, device=device)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def record(self, step: int, **metrics: torch.Tensor):
+        slot = self.count % self.capacity
+        self.steps[slot] = step
+        for column, name in enumerate(self.names):
+            self.values[slot, column] = metrics[name].detach()
+        self.count += 1
+
+    def _order(self) -> torch.Tensor:
+        # Slots from oldest to newest.
+        if self.count <= self.capacity:
+            return torch.arange(self.count, device=self.values.device)
+        return torch.arange(self.count, self.count + self.capacity, device=self.values.device) % self.capacity
+
+    def materialise(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies the recorded steps to the host, oldest first.
+        Returns:
+            steps: int64 array of shape (recorded,)
+            values: float32 array of shape (recorded, metrics)
+        """
+        order = self._order()
+        return self.steps[order].cpu().numpy(), self.values[order].cpu().numpy()
+
+    def series(self) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """The recorded steps, and each metric's values by name."""
+        steps, values = self.materialise()
+        return steps, {name: values[:, column] for column, name in enumerate(self.names)}
+
+    def summary(self, window: int) -> Dict[str, float]:
+        """Latest value of every metric, and its moving average over the last window steps
+            as <name>_avg, with a single transfer to the host.
+        """
+        if self.count == 0:
+            return {}
+
+        recent = torch.arange(self.count - min(window, len(self)), self.count, device=self.values.device) % self.capacity
+        latest = self.values[(self.count - 1) % self.capacity]
+        average = self.values[recent].mean(dim=0)
+
+        latest, average = torch.stack([latest, average]).cpu().tolist()
+        result = dict(zip(self.names, latest))
+        result.update({name + "_avg": value for name, value in zip(self.names, average)})
+        return result
+
+    def moving_average(self, window: int) -> Dict[str, np.ndarray]:
+        """Trailing moving average of every metric over window steps, for each recorded step."""
+        _, values = self.materialise()
+        cumulative = np.cumsum(np.concatenate([np.zeros((1, len(self.names))), values]), axis=0)
+
+        ends = np.arange(1, len(values) + 1)
+        starts = np.maximum(ends - window, 0)
+        averages = (cumulative[ends] - cumulative[starts]) / (ends - starts)[:, None]
+        return {name: averages[:, column] for column, name in enumerate(self.names)}
+
+    def state_dict(self) -> Dict:
+        steps, values = self.materialise()
+        return {"names": self.names, "count": self.count, "steps": torch.from_numpy(steps), "values": torch.from_numpy(values)}
+
+    def load_state_dict(self, state: Dict):
+        """Restores recorded steps, e.g. from a checkpoint. Only the newest capacity of them are kept."""
+        if list(state["names"]) != self.names:
+            raise ValueError("Metrics " + str(state["names"]) + " don't match " + str(self.names))
+
+        kept = min(len(state["steps"]), self.capacity)
+        self.count = state["count"]
+        slots = torch.arange(self.count - kept, self.count) % self.capacity
+        self.steps[slots] = state["steps"][len(state["steps"]) - kept:].to(self.steps.device)
+        self.values[slots] = state["values"][len(state["values"]) - kept:].to(self.values.device)
+
+    def to_csv(self, path: str):
+        steps, values = self.materialise()
+        table = np.column_stack([steps, values])
+        np.savetxt(path, table, delimiter=",", header=",".join(["step"] + self.names), comments="",
+            fmt=["%d"] + ["%.9g"] * len(self.names))
+
+    def to_npz(self, path: str):
+        steps, values = self.materialise()
+        np.savez(path, step=steps, **{name: values[:, column] for column, name in enumerate(self.names)})
+
+    def save(self, path: str):
+        """Exports to CSV or NPZ, by the extension of path."""
+        if path.endswith(".csv"):
+            self.to_csv(path)
+        elif path.endswith(".npz"):
+            self.to_npz(path)
+        else:
+            raise ValueError("Unknown metrics format for " + path + ", expected .csv or .npz")
+
+
+# Writes loss plots to image files from a background thread, so training never waits on matplotlib.
+#       Figures are drawn straight onto an Agg canvas rather than through pyplot, whose global
+#       state isn't safe to touch from a second thread.
+class PlotWriter:
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="PlotWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, filename: str, x: Sequence, series: Dict[str, Sequence], xlabel: str = "Iterations", ylabel: str = "Loss"):
+        """Queues a line plot of each named series against x. The data is copied, training may keep appending."""
+        self._queue.put((filename, list(x), {name: list(values) for name, values in series.items()}, xlabel, ylabel))
+
+    def _run(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            filename, x, series, xlabel, ylabel = job
+            figure = Figure()
+            FigureCanvasAgg(figure)
+            axes = figure.add_subplot()
+            for name, values in series.items():
+                axes.plot(x, values, label=name)
+            axes.legend()
+            axes.set_xlabel(xlabel)
+            axes.set_ylabel(ylabel)
+            figure.savefig(os.path.join(self.directory, filename))
+
+    def close(self):
+        """Waits for every queued plot to be written."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+# Structured training log for headless runs.
+#       Each record is one JSON object per line, e.g.
+#           {"model": "vert", "step": 1000, "time": 12.5, "g_loss": 0.69, "d_loss": 0.71}
+class TrainingLog:
+
+    def __init__(self, path: Optional[str] = "training_log.jsonl", log_every: int = 100, plot_dir: Optional[str] = "plots"):
+        """
+        Args:
+            path: JSON lines file the records are appended to, None keeps them in memory only.
+            log_every: Number of training steps between records.
+            plot_dir: Folder the loss plots are written to, None disables plotting.
+        """
+        self.path = path
+        self.log_every = log_every
+        self.records: List[Dict] = []
+
+        self._file = open(path, "a") if path is not None else None
+        self._plots = PlotWriter(plot_dir) if plot_dir is not None else None
+        self._start_time = time.time()
+
+    def should_log(self, step: int) -> bool:
+        return step % self.log_every == 0
+
+    def log(self, model: str, step: int, **metrics: float):
+        record = {"model": model, "step": step, "time": time.time() - self._start_time}
+        record.update({name: float(value) for name, value in metrics.items()})
+        self.records.append(record)
+
+        if self._file is not None:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    def plot(self, filename: str, x: Sequence, series: Dict[str, Sequence], **kwargs):
+        if self._plots is not None:
+            self._plots.submit(filename, x, series, **kwargs)
+
+    def close(self):
+        if self._plots is not None:
+            self._plots.close()
+        if self._file is not None:
+            self._file.close()
@@ -1,12 +1,19 @@
-from os import listdir
-from os.path import isfile, join
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
 
 from codecs import decode
 import struct
+import numpy as np
 
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
+
+from AnvilConfig import get_paths
+from FileScanner import FileScanner, has_extension
+from TerrainSerializer import format_vector3, mesh_to_json
+from BitCodec import float_bit_planes, floats_to_strings, ints_to_strings, pad_rows, strings_to_floats, strings_to_ints
 
 # BINARY FUNCTIONS
+#       Scalar conversions, one value at a time. BitCodec converts whole arrays, with identical bits.
 def int_to_bytes(n, length):  # Helper function
     """ Int/long to byte string.
 
@@ -89,222 +96,317 @@ class Vector3:
         self.z = z
 
     def toJSON(self):
-        jsonString = '{'
         # { "x": 1, "y": 0, "z": 1 }
-        jsonString += ('"x":' + str(self.x) + ',"y":' + str(self.y) + ',"z":' + str(self.z))
-        jsonString += '}'
-
-        return jsonString
+        return format_vector3(self)
 
 # Terrain Mesh Data
+#       Backed by one (N, 3) vertex buffer and one flat index buffer. The training channels
+#       (x/y/z, verts_vector) and their bit plane views are derived on first access and cached.
+#       The bit planes are always of float64 values, but meshes read by load_obj_arrays() hold float32
+#       verts, so their channels are of the float32 coordinates rather than the file's full decimals.
 class MeshData:
-    
-    def __init__(self, worldPos, verts, indices):
-        self.MAX_VERTS = 1024
+    MAX_VERTS = 1024
 
+    def __init__(self, worldPos, verts, indices):
+        # verts may be a list of Vector3, or an (N, 3) float array from load_obj_arrays().
+        # indices may be a list of ints, or a flat integer array.
         self.worldPos = worldPos
         self.verts = verts
         self.indices = indices
 
-        # Float collections
-        self.verts_vector = []
-        self.x_channel = []
-        self.y_channel = []
-        self.z_channel = []
+    @property
+    def verts(self) -> np.ndarray:
+        return self.vert_array
 
-        # Binary collections
-        self.vert_bin = []
-        self.vert_list_bin = []
-        self.index_bin = []
+    @verts.setter
+    def verts(self, verts):
+        if isinstance(verts, np.ndarray):
+            self.vert_array = verts.reshape(-1, 3)
+        else:
+            self.vert_array = np.array([(v.x, v.y, v.z) for v in verts], dtype=np.float64).reshape(-1, 3)
+        self._derived = {}
 
-        self.x_bin_channel = []
-        self.y_bin_channel = []
-        self.z_bin_channel = []
+    @property
+    def indices(self) -> np.ndarray:
+        return self.index_array
 
-    
-    def toBinary(self):
-        self.vert_bin = []
-        self.vert_list_bin = []
-        self.index_bin = []
-
-        self.x_bin_channel = []
-        self.y_bin_channel = []
-        self.z_bin_channel = []
-
-        # Part one: Create vert array
-        for vert in self.verts:
-            # Assign the vert to a string
-            bin_x = float_to_bin(vert.x)
-            bin_list_x = bin_to_list(bin_x)
-            bin_y = float_to_bin(vert.y)
-            bin_list_y = bin_to_list(bin_y)
-            bin_z = float_to_bin(vert.z)
-            bin_list_z = bin_to_list(bin_z)
-
-            # print('\nNEW VERT: ')
-            # print('\tX : ' + str(vert.x))
-            # print('\tX : ' + bin_x)
-            # print('\tX : ' + str(bin_list_x))
-            # print('\n\tY : ' + str(vert.y))
-            # print('\tY : ' + bin_y)
-            # print('\tY : ' + str(bin_list_y))
-            # print('\n\tZ : ' + str(vert.z))
-            # print('\tZ : ' + bin_z)
-            # print('\tZ : ' + str(bin_list_z))
-
-            # Add the new string to our binary string
-            self.vert_bin.append(bin_x)
-            self.verts_vector.append(vert.x)
-            self.x_channel.append(vert.x)
-            self.x_bin_channel.append( bin_list_x )
-            self.vert_list_bin.append( bin_list_x )
-
-            self.vert_bin.append(bin_y)
-            self.verts_vector.append(vert.y)
-            self.y_channel.append(vert.y)
-            self.y_bin_channel.append( bin_list_y )
-            self.vert_list_bin.append( bin_list_y )
-
-            self.vert_bin.append(bin_z)
-            self.verts_vector.append(vert.z)
-            self.z_channel.append(vert.z)
-            self.z_bin_channel.append( bin_list_z )
-            self.vert_list_bin.append( bin_list_z )
-        
-        # Once the verts are filled, we equalize the tensor size
-        self.x_bin_channel = fill_vert_bin_list(self.x_bin_channel, 64, self.MAX_VERTS)
-        self.x_channel = fill_vert_list(self.x_channel, self.MAX_VERTS)
-
-        self.y_bin_channel = fill_vert_bin_list(self.y_bin_channel, 64, self.MAX_VERTS)
-        self.y_channel = fill_vert_list(self.y_channel, self.MAX_VERTS)
-
-        self.z_bin_channel = fill_vert_bin_list(self.z_bin_channel, 64, self.MAX_VERTS)
-        self.z_channel = fill_vert_list(self.z_channel, self.MAX_VERTS)
-
-        self.vert_list_bin = fill_vert_bin_list(self.vert_list_bin, 64, self.MAX_VERTS*3)
-        self.verts_vector = fill_vert_list(self.verts_vector, self.MAX_VERTS*3)
-
-        # Part two: Create index array
-        for index in self.indices:
-            bin_index = int_to_bin(index)
-            # print('NEW INDEX: ')
-            # print('\n\tI : ' + bin_index)
-            self.index_bin.append(bin_index)
+    @indices.setter
+    def indices(self, indices):
+        if isinstance(indices, np.ndarray):
+            self.index_array = indices.reshape(-1)
+        else:
+            self.index_array = np.array(indices, dtype=np.uint32).reshape(-1)
+        self._derived = {}
+
+    def _cached(self, name, build):
+        if name not in self._derived:
+            self._derived[name] = build()
+        return self._derived[name]
+
+    # Returns the verts as Vector3s.
+    def vertList(self) -> List[Vector3]:
+        return [Vector3(x, y, z) for x, y, z in self.vert_array]
+
+    # FLOAT COLLECTIONS
+    @property
+    def x_channel(self) -> np.ndarray:
+        return self._cached('x_channel', lambda: pad_rows(self.vert_array[:, 0], self.MAX_VERTS))
+
+    @property
+    def y_channel(self) -> np.ndarray:
+        return self._cached('y_channel', lambda: pad_rows(self.vert_array[:, 1], self.MAX_VERTS))
+
+    @property
+    def z_channel(self) -> np.ndarray:
+        return self._cached('z_channel', lambda: pad_rows(self.vert_array[:, 2], self.MAX_VERTS))
+
+    @property
+    def verts_vector(self) -> np.ndarray:
+        # x0, y0, z0, x1, y1, z1 ...
+        return self._cached('verts_vector', lambda: pad_rows(self.vert_array.reshape(-1), self.MAX_VERTS*3))
+
+    # BINARY COLLECTIONS, rows of 64 bits (IEEE 754 binary64, big endian)
+    @property
+    def vert_list_bin(self) -> np.ndarray:
+        return self._cached('vert_list_bin', lambda: pad_rows(float_bit_planes(self.vert_array.reshape(-1)), self.MAX_VERTS*3))
+
+    @property
+    def x_bin_channel(self) -> np.ndarray:
+        return self._cached('x_bin_channel', lambda: pad_rows(float_bit_planes(self.vert_array[:, 0]), self.MAX_VERTS))
+
+    @property
+    def y_bin_channel(self) -> np.ndarray:
+        return self._cached('y_bin_channel', lambda: pad_rows(float_bit_planes(self.vert_array[:, 1]), self.MAX_VERTS))
+
+    @property
+    def z_bin_channel(self) -> np.ndarray:
+        return self._cached('z_bin_channel', lambda: pad_rows(float_bit_planes(self.vert_array[:, 2]), self.MAX_VERTS))
+
+    @property
+    def vert_bin(self) -> List[str]:
+        # One float_to_bin() string per coordinate
+        return self._cached('vert_bin', lambda: floats_to_strings(self.vert_array))
+
+    @property
+    def index_bin(self) -> List[str]:
+        # One int_to_bin() string per index
+        return self._cached('index_bin', lambda: ints_to_strings(self.index_array))
 
+    def toBinary(self):
+        """Derives every channel and bit plane view up front. They are otherwise built
+            lazily, on first access."""
+        self._derived = {}
+        for name in ('x_channel', 'y_channel', 'z_channel', 'verts_vector', 'vert_list_bin',
+                     'x_bin_channel', 'y_bin_channel', 'z_bin_channel', 'vert_bin', 'index_bin'):
+            getattr(self, name)
 
     def fromBinary(self, vert_bin, index_bin):
-        verts = []
-        indices = []
-        for step in range(0, len(vert_bin), 3):
-            newVec = Vector3(
-                    bin_to_float(vert_bin[step]),
-                    bin_to_float(vert_bin[step+1]),
-                    bin_to_float(vert_bin[step+2])
-                )
-            verts.append(newVec)
-
-        for index in index_bin:
-            indices.append( bin_to_int(index) )
-
-        self.verts = verts
-        self.indices = indices
+        self.verts = strings_to_floats(vert_bin).reshape(-1, 3)
+        self.indices = strings_to_ints(index_bin).astype(np.uint32)
 
     def toJSON(self):
-        jsonString = '{'
-        # "worldPos": { "x": 1, "y": 0, "z": 1 },
-        jsonString += '"worldPos":' + self.worldPos.toJSON() + ', '
+        # {"worldPos":{...}, "verts":[{...}, {...}], "indices":[0, 1, 2]}
+        return mesh_to_json(self)
+
+# File names are matched on their last extension, any case, e.g. "island.v2.obj".
+WAVEFRONT_EXTENSIONS = (".obj",)
+
+def iswavefront(filename):
+    return has_extension(filename, WAVEFRONT_EXTENSIONS)
+
+# Byte values used by the bulk OBJ loader
+OBJ_NEWLINE = ord('\n')
+OBJ_SPACE = ord(' ')
+OBJ_SLASH = ord('/')
+OBJ_LINE_VERT = 1
+OBJ_LINE_FACE = 2
+
+def obj_token_starts(separators: np.ndarray) -> np.ndarray:
+    # A token starts on any non separator byte that follows a separator (or the start of the block)
+    starts = ~separators
+    starts[1:] &= separators[:-1]
+    return starts
+
+def obj_tokens_per_line(token_starts: np.ndarray, block: np.ndarray, num_lines: int) -> np.ndarray:
+    # Every line in a block ends in a newline, count the tokens that start before each one.
+    tokens_before = np.searchsorted(np.flatnonzero(token_starts), np.flatnonzero(block == OBJ_NEWLINE))
+    return np.diff(tokens_before, prepend=0)[:num_lines]
+
+def parse_obj_numbers(block: np.ndarray, dtype, expected: int) -> np.ndarray:
+    # Let numpy parse the whole whitespace separated block in C, and make sure nothing was dropped.
+    numbers = np.fromstring(block.tobytes(), dtype=dtype, sep=' ') if expected else np.zeros(0, dtype=dtype)
+    if numbers.size != expected:
+        raise ValueError("Malformed OBJ data, expected " + str(expected) + " values, found " + str(numbers.size))
+    return numbers
+
+def parse_obj_indices(block: np.ndarray, token_starts: np.ndarray, separators: np.ndarray) -> np.ndarray:
+    # Decode (optionally negative) integers straight from their digits, one digit place per pass.
+    begin = np.flatnonzero(token_starts)
+    separator_positions = np.flatnonzero(separators)
+    end = separator_positions[np.searchsorted(separator_positions, begin)]
+
+    negative = block[begin] == ord('-')
+    begin = begin + negative
+    length = end - begin
+
+    values = np.zeros(len(begin), dtype=np.int64)
+    for place in range(int(length.max()) if len(length) else 0):
+        active = length > place
+        digits = block[np.minimum(begin + place, len(block) - 1)].astype(np.int64) - ord('0')
+        if ((digits < 0) | (digits > 9))[active].any():
+            raise ValueError("Malformed OBJ data, face index is not an integer")
+        values = np.where(active, values * 10 + digits, values)
+
+    if (length <= 0).any():
+        raise ValueError("Malformed OBJ data, empty face index")
+
+    return np.where(negative, -values, values)
+
+def load_obj_arrays(filePath) -> Tuple[np.ndarray, np.ndarray]:
+    """Reads a wavefront file in bulk, without building per-line or per-vertex Python objects.
+    Args:
+        filePath: Path of the .obj file.
+    Returns:
+        verts: Contiguous float32 array of shape (N, 3). Coordinates are rounded to float32, so
+            channels derived from them can differ from ones parsed with float() in the last bits.
+        indices: Contiguous uint32 array of shape (M, 3), zero based. Polygons with more than
+            three corners are fan triangulated, negative (relative) indices are resolved.
+    """
+    with open(filePath, 'rb') as objFile:
+        text = np.frombuffer(objFile.read() + b'\n', dtype=np.uint8).copy()
 
-        # "verts" : [ {"x": 5.4, "y": 3.8, "z": 2.1 }, {"x": 1.2, "y": 0.52, "z": -2.1 } ],
-        count = 0
-        maxVerts = len(self.verts)
+    # 1. Classify every line by its first two bytes, then spread that type over the line's bytes.
+    newlines = np.flatnonzero(text == OBJ_NEWLINE)
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
 
-        jsonString += '"verts":['
+    first = text[line_starts]
+    separated = text[np.minimum(line_starts + 1, len(text) - 1)] <= OBJ_SPACE
 
-        # Start Vert Loop
-        for vert in self.verts:
-            jsonString += vert.toJSON()
+    line_type = np.zeros(len(line_starts), dtype=np.uint8)
+    line_type[(first == ord('v')) & separated] = OBJ_LINE_VERT
+    line_type[(first == ord('f')) & separated] = OBJ_LINE_FACE
 
-            count += 1
-            if count < maxVerts:
-                jsonString += ', '
-        # End Vert Loop
-        jsonString += '], '
+    byte_type = np.repeat(line_type, newlines - line_starts + 1)
 
+    # Drop trailing comments on vert and face lines, anything after the '#'.
+    for hash_pos in np.flatnonzero((text == ord('#')) & (byte_type > 0)):
+        byte_type[hash_pos:newlines[np.searchsorted(newlines, hash_pos)]] = 0
 
-        # "indices" : [ 0, 1, 2 ]
-        count = 0
-        maxIndices = len(self.indices)
+    # Blank out the 'v' / 'f' keyword so only numbers remain.
+    text[line_starts[line_type > 0]] = OBJ_SPACE
 
-        jsonString += '"indices":['
+    # 2. Verts, every "v" line holds x y z (and optionally w / colour, which we drop)
+    vert_block = text[byte_type == OBJ_LINE_VERT]
+    vert_starts = obj_token_starts(vert_block <= OBJ_SPACE)
+    vert_counts = obj_tokens_per_line(vert_starts, vert_block, int(np.count_nonzero(line_type == OBJ_LINE_VERT)))
+    if (vert_counts < 3).any():
+        raise ValueError("Malformed OBJ data, vertex with fewer than 3 coordinates in " + str(filePath))
 
-        # Start Index Loop
-        for index in self.indices:
-            jsonString += str(index)
+    verts = parse_obj_numbers(vert_block, np.float32, int(vert_counts.sum()))
+    if (vert_counts != 3).any():
+        rank = np.arange(verts.size) - np.repeat(np.cumsum(vert_counts) - vert_counts, vert_counts)
+        verts = verts[rank < 3]
+    verts = verts.reshape(-1, 3)
 
-            count += 1
-            if count < maxIndices:
-                jsonString += ', '
-        # End Index Loop
-        jsonString += ']'
+    # 3. Faces, keep only the vertex index of each v/vt/vn corner
+    face_block = text[byte_type == OBJ_LINE_FACE]
+    face_lines = np.flatnonzero(line_type == OBJ_LINE_FACE)
 
-        jsonString += '}'
+    whitespace = face_block <= OBJ_SPACE
+    corner_starts = obj_token_starts(whitespace)
+    face_counts = obj_tokens_per_line(corner_starts, face_block, len(face_lines))
+    if (face_counts < 3).any():
+        raise ValueError("Malformed OBJ data, face with fewer than 3 corners in " + str(filePath))
 
-        return jsonString
+    corners = parse_obj_indices(face_block, corner_starts, whitespace | (face_block == OBJ_SLASH))
 
-def iswavefront(filename):
-    file_split = filename.split(sep=".")
-    return file_split[1] == "obj"
+    # Resolve to zero based indices. Negative indices count back from the verts read so far.
+    if (corners < 0).any():
+        verts_so_far = np.cumsum(line_type == OBJ_LINE_VERT)[face_lines]
+        corners = np.where(corners < 0, corners + np.repeat(verts_so_far, face_counts), corners - 1)
+    else:
+        corners = corners - 1
+
+    # 4. Fan triangulate: a face (c0, c1, ... ck) becomes (c0, ci, ci+1) for i in 1..k-1
+    if (face_counts == 3).all():
+        indices = corners.reshape(-1, 3)
+    else:
+        tris_per_face = face_counts - 2
+        first_corner = np.cumsum(face_counts) - face_counts
+        first_tri = np.cumsum(tris_per_face) - tris_per_face
+
+        face_of_tri = np.repeat(np.arange(len(face_counts)), tris_per_face)
+        corner = np.arange(int(tris_per_face.sum())) - first_tri[face_of_tri] + 1
+        base = first_corner[face_of_tri]
+
+        indices = np.stack([corners[base], corners[base + corner], corners[base + corner + 1]], axis=1)
+
+    if indices.size and (indices.min() < 0 or indices.max() >= len(verts)):
+        raise ValueError("Malformed OBJ data, face index out of range in " + str(filePath))
+
+    return np.ascontiguousarray(verts), np.ascontiguousarray(indices, dtype=np.uint32)
 
 # Given a file path, return a mesh data
+#       The mesh wraps the loaded arrays directly (indices as a flat view).
 def loadMeshFromFile(filePath):
-    parsedVerts = []
-    parsedIndices = []
-
-    # Using readlines()
-    objFile = open(filePath, 'r')
- 
-    while True:
-        # Get next line from file
-        line = objFile.readline()
-
-        # if line is empty
-        # end of file is reached
-        if not line:
-            break
-        
-        # 1. Itemize the string
-        entry = line.split(' ')
-
-        # 2. Get the first character of the line.
-        lineType = entry[0]
-
-        # 3. If v -> entry[1] - entry[4]
-        if lineType == 'v':
-            parsedVert = parseVertEntry(entry)
-
-            parsedVerts.append( parsedVert )
-
-        # 3. If t -> entry[1] - entry[4]
-        elif lineType == 'f':
-            parsedIndexGroup = parseIndexEntry(entry)
-            parsedIndices.append( parsedIndexGroup.x )
-            parsedIndices.append( parsedIndexGroup.y )
-            parsedIndices.append( parsedIndexGroup.z )
+    verts, indices = load_obj_arrays(filePath)
+
+    return MeshData(Vector3(0,0,0), verts, indices.reshape(-1))
+
+# Below this many files a process pool costs more to start than it saves.
+PARALLEL_MIN_FILES = 64
+
+def parse_obj_file(filePath) -> Tuple[Optional[Tuple[np.ndarray, np.ndarray]], Optional[str]]:
+    # load_obj_arrays() for a pool worker: a bad file is returned as an error, so it can't take the whole load down.
+    try:
+        return load_obj_arrays(filePath), None
+    except Exception as ex:
+        return None, type(ex).__name__ + ": " + str(ex)
+
+def parse_obj_files(filePaths: Sequence[str], workers: int = 1) -> List[Tuple[Optional[Tuple[np.ndarray, np.ndarray]], Optional[str]]]:
+    """Parses wavefront files, spread over a pool of processes.
+    Args:
+        filePaths: Paths of the .obj files
+        workers: Processes to parse with, 1 or fewer parses in this process, as do small batches
+    Returns:
+        For each path, in the same order, its (verts, indices) as load_obj_arrays() returns them
+        and None, or None and the reason it couldn't be parsed.
+    """
+    workers = min(workers, len(filePaths))
+    if workers <= 1 or len(filePaths) < PARALLEL_MIN_FILES:
+        return [parse_obj_file(path) for path in filePaths]
 
-        else:
-            pass
+    # map() hands results back in input order, whichever worker finishes first.
+    chunk_size = max(1, len(filePaths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(parse_obj_file, filePaths, chunksize=chunk_size))
 
-    mesh = MeshData(Vector3(0,0,0), parsedVerts, parsedIndices)
-    mesh.toBinary()
-    return mesh
+def report_parse_failures(failures: Sequence[Tuple[str, str]]):
+    for filePath, error in failures:
+        print("Skipped", filePath, "-", error)
+    if failures:
+        print("Skipped", len(failures), "islands that couldn't be loaded")
 
 # Load the training set from the folder, and generate a training set
 #       Tuple[0] ( label : 1  ||  vert(64) : [ [ 1, 0, 1, 1, 0, 1, 0, 0  ... ], [ 1, 0, 1, 1, 0, 1, 0, 0  ... ] ]  || index(16) : [ [ 0, 0, 1, 1, ... ], [ 0, 0, 1, 1, ... ] ] )
 #       batch_size : How many total inputs are loaded.
-def load_island_data() -> Tuple[ List[int], List[ MeshData ] ]:
-    tempFilePath = "C:/AnvilTerrainEditor/Python/IslandSet/"
+#       use_cache : Read the islands from the memory-mapped IslandCache, re-parsing only changed files.
+#       workers : Processes parsing the files, islands come back in file name order however many there are.
+#       Files that can't be parsed are reported and left out.
+#       tempFilePath : The configured island set if None, see AnvilConfig.
+def load_island_data(tempFilePath: Optional[str] = None, use_cache: bool = True, workers: int = 1) -> Tuple[ List[int], List[ MeshData ] ]:
 
     print("Loading Terrain Data ...")
+    if tempFilePath is None:
+        tempFilePath = get_paths().island_set
+
+    if use_cache:
+        # IslandCache imports this module, so it's imported on use.
+        from IslandCache import load_island_cache
+
+        loaded_islands = load_island_cache(tempFilePath, workers=workers).meshes()
+        return [1] * len(loaded_islands), loaded_islands
+
     # # Get the number of binary places needed to represent the maximum number
     max_length = 64
 
@@ -312,19 +414,20 @@ def load_island_data() -> Tuple[ List[int], List[ MeshData ] ]:
     # # sampled_integers = np.random.randint(0, int(max_int / 2), batch_size)
     loaded_islands = []
 
-    # Get all file names from the directory.
-    onlyfiles = [f for f in listdir(tempFilePath) if (isfile(join(tempFilePath, f)))]
-
-    # Iterate through each filepath
-    for file in onlyfiles:
+    # Get all wavefront file paths under the directory, sorted so every load sees the same order.
+    onlyfiles = [join(tempFilePath, f) for f in FileScanner(tempFilePath, WAVEFRONT_EXTENSIONS).scan()]
 
-        if not iswavefront(file):
+    # Parse them, possibly in parallel, keeping the ones that loaded
+    failures = []
+    for file, (arrays, error) in zip(onlyfiles, parse_obj_files(onlyfiles, workers)):
+        if error is not None:
+            failures.append((file, error))
             continue
 
-        newIsland = loadMeshFromFile(tempFilePath+file)
-        island_verts = newIsland.vert_list_bin # List [ List[int] ], single channel
-        
-        loaded_islands.append(newIsland)
+        verts, indices = arrays
+        loaded_islands.append(MeshData(Vector3(0,0,0), verts, indices.reshape(-1)))
+
+    report_parse_failures(failures)
 
     # # create a list of labels all ones because all numbers are even
     labels = [1] * len(loaded_islands)